@@ -0,0 +1,398 @@
+"""
+Incremental usage analytics.
+
+A rollup job streams `translations` and `quiz_results` documents written
+since a stored watermark, in timestamp order and paginated batches, and
+folds them into one summary document per day:
+
+    analytics_daily/{YYYY-MM-DD}
+        translations, quizzes, questions, correct_answers, accuracy,
+        active_users, pairs {'en>es': count},
+        languages {code: {translations, quizzes, questions, correct_answers,
+                          accuracy, active_users}}
+
+Daily active users are HyperLogLog estimates (about 1.6% error). The
+register sketches sit in `analytics_sketches/{date}`, so later runs can
+merge into them. Day updates are written in one batch together with the
+new watermark, so a crashed run resumes where its last batch ended without
+counting anything twice. A page that touches more days than a batch can
+hold is committed in several batches, each with its own watermark. Days are bucketed by the stored
+timestamp's date. Run one job at a time.
+
+With an export directory, every page is also written as a columnar file
+(Parquet when pyarrow is installed, otherwise gzipped JSON of column
+lists) under <dir>/<collection>/ for offline analysis.
+
+Dashboards read `analytics_daily` through get_daily_rollups, never the
+raw collections. Nobody may read them until ANALYTICS_TOKEN (a bearer
+token) or ANALYTICS_ADMINS (comma-separated account emails) is set.
+
+    python analytics_service.py [--export-dir DIR] [--page-size N]
+"""
+import argparse
+import calendar
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import sys
+from datetime import date, datetime, timedelta
+from app_logging import get_logger, log_event
+from firebase_models import MAX_BATCH_WRITES
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # optional; exports fall back to gzipped JSON columns
+    pyarrow = None
+    parquet = None
+
+logger = get_logger(__name__)
+
+# Page size for streaming events
+BATCH_SIZE = 500
+
+# Days one batch can update: two documents per day, plus the watermark
+MAX_DAYS_PER_BATCH = (MAX_BATCH_WRITES - 1) // 2
+
+# Events younger than this are left for the next run, so documents still
+# being written with a slightly older client timestamp are not skipped
+SETTLE_SECONDS = 120
+
+# HyperLogLog precision: 2**12 one-byte registers, ~1.6% standard error
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+EXPORT_DIR = os.getenv('ANALYTICS_EXPORT_DIR')
+
+# Who may read the rollups; with neither set, nobody can
+ACCESS_TOKEN = os.getenv('ANALYTICS_TOKEN')
+ADMIN_EMAILS = frozenset(email.strip().lower()
+                         for email in os.getenv('ANALYTICS_ADMINS', '').split(',') if email.strip())
+
+# Longest range the dashboard endpoint returns
+MAX_DAYS = 366
+
+STATE_DOC = ('analytics_state', 'rollup')
+
+# collection -> fields read from each event
+SOURCES = {
+    'translations': ['user_id', 'source_lang', 'target_lang', 'timestamp'],
+    'quiz_results': ['user_id', 'language', 'score', 'total_questions', 'correct_answers', 'timestamp'],
+}
+
+
+class UserSketch:
+    """HyperLogLog distinct-user counter"""
+
+    __slots__ = ('registers',)
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(HLL_REGISTERS)
+
+    def add(self, user_id):
+        # Stable across processes, unlike hash()
+        value = int.from_bytes(hashlib.blake2b(user_id.encode(), digest_size=8).digest(), 'big')
+        index = value >> (64 - HLL_PRECISION)
+        rest = value & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        m = HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+def _accuracy(correct, questions):
+    return round(correct / questions, 4) if questions else None
+
+
+def _empty_counts():
+    return {'translations': 0, 'quizzes': 0, 'questions': 0, 'correct_answers': 0,
+            'accuracy': None, 'active_users': 0}
+
+
+class DayRollup:
+    """One day's summary plus its user sketches, as loaded from and written to Firestore"""
+
+    __slots__ = ('day', 'summary', 'users', 'language_users', 'dirty')
+
+    def __init__(self, day, summary=None, sketches=None):
+        self.day = day
+        self.summary = summary or dict(_empty_counts(), date=day, pairs={}, languages={})
+        sketches = sketches or {}
+        self.users = UserSketch(sketches.get('all'))
+        self.language_users = {code: UserSketch(registers)
+                               for code, registers in (sketches.get('languages') or {}).items()}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, db, day):
+        summary = db.collection('analytics_daily').document(day).get()
+        sketches = db.collection('analytics_sketches').document(day).get()
+        return cls(day,
+                   summary.to_dict() if summary.exists else None,
+                   sketches.to_dict() if sketches.exists else None)
+
+    def _language(self, code):
+        counts = self.summary['languages'].get(code)
+        if counts is None:
+            counts = self.summary['languages'][code] = _empty_counts()
+        return counts
+
+    def _seen(self, user_id, code):
+        if not user_id:
+            return
+        self.users.add(user_id)
+        sketch = self.language_users.get(code)
+        if sketch is None:
+            sketch = self.language_users[code] = UserSketch()
+        sketch.add(user_id)
+
+    def add_translation(self, data):
+        source = data.get('source_lang') or 'auto'
+        target = data.get('target_lang') or 'unknown'
+        pair = f"{source}>{target}"
+        self.summary['translations'] += 1
+        self.summary['pairs'][pair] = self.summary['pairs'].get(pair, 0) + 1
+        self._language(target)['translations'] += 1
+        self._seen(data.get('user_id'), target)
+        self.dirty = True
+
+    def add_quiz(self, data):
+        code = data.get('language') or 'unknown'
+        questions = data.get('total_questions') or 0
+        correct = data.get('correct_answers') or 0
+        counts = self._language(code)
+        for target in (self.summary, counts):
+            target['quizzes'] += 1
+            target['questions'] += questions
+            target['correct_answers'] += correct
+        self._seen(data.get('user_id'), code)
+        self.dirty = True
+
+    def write(self, batch, db):
+        """Queue this day's summary and sketch documents on a write batch"""
+        self.summary['active_users'] = self.users.estimate()
+        self.summary['accuracy'] = _accuracy(self.summary['correct_answers'], self.summary['questions'])
+        for code, counts in self.summary['languages'].items():
+            sketch = self.language_users.get(code)
+            counts['active_users'] = sketch.estimate() if sketch else 0
+            counts['accuracy'] = _accuracy(counts['correct_answers'], counts['questions'])
+        self.summary['updated_at'] = datetime.now()
+        batch.set(db.collection('analytics_daily').document(self.day), self.summary)
+        batch.set(db.collection('analytics_sketches').document(self.day), {
+            'all': bytes(self.users.registers),
+            'languages': {code: bytes(sketch.registers) for code, sketch in self.language_users.items()},
+        })
+        self.dirty = False
+
+
+def _day(timestamp):
+    return timestamp.date().isoformat()
+
+
+def _epoch_ms(timestamp):
+    """Milliseconds since the epoch; naive timestamps are taken as UTC, as Firestore stores them"""
+    if timestamp.tzinfo is not None:
+        return int(timestamp.timestamp() * 1000)
+    return calendar.timegm(timestamp.timetuple()) * 1000 + timestamp.microsecond // 1000
+
+
+def _columns(collection, docs):
+    """Column lists for one page of events (no free text)"""
+    rows = [(doc.id, doc.to_dict()) for doc in docs]
+    columns = {
+        'id': [doc_id for doc_id, _ in rows],
+        'timestamp_ms': [_epoch_ms(data['timestamp']) for _, data in rows],
+        'user_id': [data.get('user_id') for _, data in rows],
+    }
+    if collection == 'translations':
+        columns['source_lang'] = [data.get('source_lang') for _, data in rows]
+        columns['target_lang'] = [data.get('target_lang') for _, data in rows]
+    else:
+        for field in ('language', 'score', 'total_questions', 'correct_answers'):
+            columns[field] = [data.get(field) for _, data in rows]
+    return columns
+
+
+def export_page(export_dir, collection, docs):
+    """
+    Write one page as a columnar file named after its first event, so a
+    re-run of the same page overwrites rather than duplicates it.
+    """
+    first = docs[0]
+    stamp = first.to_dict()['timestamp'].strftime('%Y%m%dT%H%M%S%f')
+    directory = os.path.join(export_dir, collection)
+    os.makedirs(directory, exist_ok=True)
+    columns = _columns(collection, docs)
+    if parquet is not None:
+        path = os.path.join(directory, f"{stamp}-{first.id}.parquet")
+        tmp_path = path + '.tmp'
+        parquet.write_table(pyarrow.table(columns), tmp_path)
+    else:
+        path = os.path.join(directory, f"{stamp}-{first.id}.columns.json.gz")
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(columns, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return path
+
+
+def _stream_pages(db, collection, watermark, cutoff, page_size):
+    """Pages of events after the watermark and before cutoff, oldest first"""
+    query = db.collection(collection).select(SOURCES[collection])
+    skip_ids = set()
+    if watermark:
+        # >= plus skipping ids already counted handles events sharing the watermark timestamp
+        query = query.where('timestamp', '>=', watermark['timestamp'])
+        skip_ids = set(watermark.get('ids') or ())
+    query = query.where('timestamp', '<', cutoff)\
+                 .order_by('timestamp')\
+                 .order_by('__name__')\
+                 .limit(page_size)
+
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        docs = list(page.stream())
+        if not docs:
+            return
+        last_doc = docs[-1]
+        fresh = [doc for doc in docs if doc.id not in skip_ids]
+        if fresh:
+            yield fresh
+        if len(docs) < page_size:
+            return
+
+
+def _next_watermark(watermark, docs):
+    """Last timestamp seen and the ids of every event at exactly that timestamp"""
+    last = docs[-1].to_dict()['timestamp']
+    ids = [doc.id for doc in docs if doc.to_dict()['timestamp'] == last]
+    if watermark and watermark['timestamp'] == last:
+        ids = list(watermark.get('ids') or ()) + ids
+    return {'timestamp': last, 'ids': ids}
+
+
+def _commit(db, state_ref, collection, watermark, days, docs):
+    """Write the dirty days and the watermark past docs in one batch; returns the new watermark"""
+    watermark = _next_watermark(watermark, docs)
+    batch = db.batch()
+    for rollup in days.values():
+        if rollup.dirty:
+            rollup.write(batch, db)
+    batch.set(state_ref, {collection: watermark, 'updated_at': datetime.now()}, merge=True)
+    batch.commit()
+    return watermark
+
+
+def run_rollup_job(db, now=None, page_size=BATCH_SIZE, export_dir=EXPORT_DIR):
+    """
+    Fold events newer than the stored watermarks into the daily rollups.
+    One read per page of events, plus two point reads the first time a day
+    is touched; one write batch per page, or per MAX_DAYS_PER_BATCH days.
+    """
+    cutoff = (now or datetime.now()) - timedelta(seconds=SETTLE_SECONDS)
+    state_ref = db.collection(STATE_DOC[0]).document(STATE_DOC[1])
+    state_doc = state_ref.get()
+    watermarks = state_doc.to_dict() if state_doc.exists else {}
+
+    totals = {}
+    exported = 0
+    for collection in SOURCES:
+        watermark = watermarks.get(collection)
+        days = {}
+        processed = 0
+        for docs in _stream_pages(db, collection, watermark, cutoff, page_size):
+            start = 0
+            dirty_days = 0
+            for index, doc in enumerate(docs):
+                data = doc.to_dict()
+                day = _day(data['timestamp'])
+                rollup = days.get(day)
+                if rollup is None:
+                    rollup = days[day] = DayRollup.load(db, day)
+                if not rollup.dirty:
+                    if dirty_days == MAX_DAYS_PER_BATCH:
+                        # Sparse history: commit what this page has counted so far
+                        watermark = _commit(db, state_ref, collection, watermark, days, docs[start:index])
+                        start = index
+                        dirty_days = 0
+                    dirty_days += 1
+                if collection == 'translations':
+                    rollup.add_translation(data)
+                else:
+                    rollup.add_quiz(data)
+
+            if export_dir:
+                export_page(export_dir, collection, docs)
+                exported += 1
+
+            watermark = _commit(db, state_ref, collection, watermark, days, docs[start:])
+            processed += len(docs)
+
+            # Events arrive in time order; earlier days are finished and written
+            current = _day(docs[-1].to_dict()['timestamp'])
+            days = {day: rollup for day, rollup in days.items() if day >= current}
+
+        totals[collection] = processed
+
+    log_event(logger, logging.INFO, "Analytics rollup finished", exported_files=exported, **totals)
+    return dict(totals, exported_files=exported)
+
+
+def can_read(authorization, user):
+    """Bearer ANALYTICS_TOKEN, or a signed-in user listed in ANALYTICS_ADMINS"""
+    if ACCESS_TOKEN and authorization and hmac.compare_digest(
+            authorization.encode(), f"Bearer {ACCESS_TOKEN}".encode()):
+        return True
+    return bool(user.is_authenticated and user.email and user.email.lower() in ADMIN_EMAILS)
+
+
+def get_daily_rollups(db, days=30, today=None):
+    """Summary documents for the last `days` days (oldest first)"""
+    today = today or date.today()
+    start = (today - timedelta(days=max(1, min(days, MAX_DAYS)) - 1)).isoformat()
+    query = db.collection('analytics_daily')\
+              .where('date', '>=', start)\
+              .order_by('date')
+    rollups = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        updated_at = data.get('updated_at')
+        if isinstance(updated_at, datetime):
+            data['updated_at'] = updated_at.isoformat()
+        rollups.append(data)
+    return rollups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Roll new translations and quiz results into daily analytics')
+    parser.add_argument('--export-dir', default=EXPORT_DIR,
+                        help='also write each page as a columnar file here (default: $ANALYTICS_EXPORT_DIR)')
+    parser.add_argument('--page-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    import clients
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    result = run_rollup_job(clients.get_db(), page_size=args.page_size, export_dir=args.export_dir)
+    print(result)
+    if args.export_dir and parquet is None:
+        print("pyarrow not installed; exports were written as gzipped JSON columns")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,43 +1,70 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, session
-from googletrans import Translator
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, session, g, Response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+import analytics_service
+import assets
+import clients
+import event_hub
+import http_cache
+import identity
+import page_cache
+import progress_service
 import quiz_service
+import translation_service
+import translation_memory
+import vocabulary
+import language_detect
+import leaderboard_service
+import streak_service
+import metrics
+import logging
 import os
+import time
 from dotenv import load_dotenv
 from datetime import datetime
 from firebase_models import (
-    initialize_firebase, FirebaseUser, UserStats, 
+    FirebaseUser, UserStats,
     TranslationHistory, QuizResults, LanguageProgress
 )
-from firebase_admin import auth as firebase_auth
+from app_logging import get_logger, log_event
+firebase_auth = clients.lazy_module('firebase_admin.auth')
 
 # Load environment variables
 load_dotenv()
 
-import json
+logger = get_logger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__, template_folder='.', static_folder='.')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
-# Initialize Firebase
-# First check for JSON content in environment variable (Render/Cloud)
-firebase_creds = os.getenv('FIREBASE_CREDENTIALS')
-if firebase_creds:
-    # If it's a string containing JSON
-    try:
-        cred_dict = json.loads(firebase_creds)
-        db = initialize_firebase(cred_dict)
-        print("Initialized Firebase from environment variable")
-    except json.JSONDecodeError as e:
-        print(f"Error parsing FIREBASE_CREDENTIALS: {e}")
-        # Fallback
-        FIREBASE_CRED_PATH = os.getenv('FIREBASE_CREDENTIALS_PATH', 'firebase-credentials.json')
-        db = initialize_firebase(FIREBASE_CRED_PATH)
-else:
-    # Fallback to file path (Local)
-    FIREBASE_CRED_PATH = os.getenv('FIREBASE_CREDENTIALS_PATH', 'firebase-credentials.json')
-    db = initialize_firebase(FIREBASE_CRED_PATH)
+# Fingerprinted /assets/ URLs, asset_url() in templates, no session for asset requests
+assets.init_app(app)
+
+# Compress large JSON responses (conditional GET is per endpoint, see http_cache.conditional)
+http_cache.init_app(app)
+
+# Page shells rendered once per process, plus the Jinja bytecode cache
+page_cache.pages.init_app(app)
+
+# Firestore client, created lazily per process on first use (see clients.py)
+db = clients.db
+
+def warm_up():
+    """Create clients and load models before the first request (gunicorn post_worker_init)"""
+    started = time.perf_counter()
+    clients.get_db()
+    clients.get_translator()
+    language_detect.load_model()
+    vocabulary.get_vocabulary()
+    assets.manifest.load()
+    page_cache.pages.warm()
+    if event_hub.EVENTS_PORT and event_hub.hub.enabled:
+        event_hub.hub.serve(event_hub.session_authenticator(
+            app, lambda data: identity.session_user_id(db, data)))
+    leaderboard_service.ensure_loaded(db)
+    translation_memory.ensure_loaded(db)
+    log_event(logger, logging.INFO, "Worker warmed up", pid=os.getpid(),
+              seconds=round(time.perf_counter() - started, 3))
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -46,20 +73,53 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return FirebaseUser.get_by_id(db, user_id)
+    # From the signed session claim when possible (see identity.py)
+    return identity.load_user(db, user_id)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics aggregated across all worker processes"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def events_flag():
+    """'on' when pages should open /api/events, 'off' to keep re-fetching instead"""
+    return 'on' if event_hub.hub.streaming_available() else 'off'
 
 @app.route('/')
 def index():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
-    return render_template('index.html')
+    return page_cache.pages.render('index.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
+    # Plain asset names still work, but revalidate against the ETag
+    asset = assets.manifest.get(filename)
+    if asset is not None:
+        return assets.asset_response(asset, assets.REVALIDATE_CACHE_CONTROL)
+
     # Protect dashboard and other app pages
     if filename in ['dashboard.html', 'translate.html', 'quiz.html'] and not current_user.is_authenticated:
         return redirect(url_for('login'))
         
+    if filename in page_cache.pages:
+        return page_cache.pages.render(filename, events=events_flag())
     if filename.endswith('.html'):
         return render_template(filename)
     return send_from_directory('.', filename)
@@ -72,16 +132,15 @@ def signup():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        # Check if user already exists
-        existing_user = FirebaseUser.get_by_email(db, email)
-        if existing_user:
+        # Create new user; Firebase Auth rejects emails that already exist
+        try:
+            new_user = FirebaseUser.create_user(db, email, username, password)
+        except firebase_auth.EmailAlreadyExistsError:
             flash('Email already exists')
             return redirect(url_for('signup'))
-        
-        # Create new user
-        new_user = FirebaseUser.create_user(db, email, username, password)
         if new_user:
             login_user(new_user)
+            identity.issue(new_user)
             return redirect(url_for('dashboard'))
         else:
             flash('Error creating account. Please try again.')
@@ -111,6 +170,7 @@ def login():
         try:
             user.update_last_login(db)
             login_user(user)
+            identity.issue(user)
             return redirect(url_for('dashboard'))
         except Exception as e:
             flash('An error occurred. Please try again.')
@@ -121,25 +181,32 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    # /logout?all=1 also ends the user's sessions on other devices
+    if request.args.get('all'):
+        identity.revoke(db, current_user.id)
+    identity.clear()
     logout_user()
     return redirect(url_for('index'))
 
 @app.route('/dashboard.html')
 @login_required
 def dashboard():
-    # Get user stats from Firebase
-    stats = UserStats.get_stats(db, current_user.id)
-    
-    return render_template('dashboard.html', 
-                         name=current_user.username,
-                         date_today=datetime.now().strftime("%A, %b %d"),
-                         stats=stats)
+    # Stats are loaded by the page from /api/user/stats
+    name = current_user.username
+    return page_cache.pages.render('dashboard.html',
+                                   initial=name[0] if name else 'U',
+                                   name=name,
+                                   date_today=datetime.now().strftime("%A, %b %d"),
+                                   events=events_flag())
 
 @app.route('/translate.html')
 @login_required
 def translate():
-    return render_template('translate.html',
-                         name=current_user.username)
+    name = current_user.username
+    return page_cache.pages.render('translate.html',
+                                   initial=name[0] if name else 'U',
+                                   name=name if name else 'User',
+                                   events=events_flag())
 
 # API Routes
 @app.route('/api/user/stats', methods=['GET'])
@@ -154,6 +221,7 @@ def get_user_stats():
 
 @app.route('/api/user/translations', methods=['GET'])
 @login_required
+@http_cache.conditional(http_cache.TRANSLATIONS)
 def get_user_translations():
     """Get user's translation history"""
     try:
@@ -165,6 +233,7 @@ def get_user_translations():
 
 @app.route('/api/user/quiz-results', methods=['GET'])
 @login_required
+@http_cache.conditional(http_cache.QUIZ_RESULTS)
 def get_quiz_results():
     """Get user's quiz results"""
     try:
@@ -176,6 +245,7 @@ def get_quiz_results():
 
 @app.route('/api/user/language-progress', methods=['GET'])
 @login_required
+@http_cache.conditional(http_cache.LANGUAGE_PROGRESS)
 def get_language_progress():
     """Get user's language progress"""
     try:
@@ -184,6 +254,18 @@ def get_language_progress():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/events', methods=['GET'])
+@login_required
+def user_events():
+    """Live stats/history updates for the current user (server-sent events)"""
+    stream = event_hub.hub.open_wsgi_stream(current_user.id)
+    if stream is None:
+        # No request thread to spare; the page falls back to re-fetching
+        return jsonify({'error': 'Event stream unavailable'}), 503, {'Retry-After': '60'}
+    return Response(stream,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/translate', methods=['POST'])
 def translate_text():
     try:
@@ -195,26 +277,20 @@ def translate_text():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
 
-        # Print translation request (safely handle Unicode)
-        try:
-            print(f"Translating '{text}' from {source_lang} to {target_lang}...")
-        except UnicodeEncodeError:
-            print(f"Translating text from {source_lang} to {target_lang}...")
-
-        # Initialize translator per request for stability
-        translator = Translator()
-        translation = translator.translate(text, src=source_lang, dest=target_lang)
+        translation = translation_service.translate(text, source_lang, target_lang)
+        log_event(logger, logging.INFO, "translate", sampled=True,
+                  source=source_lang, src=translation.src, dest=translation.dest, chars=len(text))
 
-        # Print translation result (safely handle Unicode)
-        try:
-            print(f"Translation result: {translation.text}")
-        except UnicodeEncodeError:
-            print(f"Translation completed (non-ASCII result)")
+        suggestions = []
 
         # Save translation to Firebase only if user is logged in
         if current_user.is_authenticated:
+            # The user's earlier translations of similar text
+            suggestions = translation_memory.memory.suggest(
+                text, translation.src, translation.dest, current_user.id
+            )
             try:
-                TranslationHistory.add_translation(
+                saved = TranslationHistory.add_translation(
                     db, 
                     current_user.id,
                     text,
@@ -222,31 +298,42 @@ def translate_text():
                     translation.src,
                     translation.dest
                 )
+                if saved:
+                    progress_service.record_translation(
+                        db, current_user.id, text, translation.src, translation.dest
+                    )
                 
                 # Increment words learned (simplified)
                 UserStats.increment_stat(db, current_user.id, 'words_learned', 1)
                 UserStats.increment_stat(db, current_user.id, 'total_points', 10)
+                leaderboard_service.record_points(
+                    db, current_user.id, 10,
+                    language=translation.dest, username=current_user.username
+                )
+                streak_service.record_activity(db, current_user.id, data.get('timezone'))
             except Exception as e:
-                print(f"Failed to save to Firebase: {e}")
+                metrics.ERRORS.inc(source='translate_save')
+                log_event(logger, logging.ERROR, "Failed to save to Firebase", error=str(e))
 
         response = {
             'original': text,
             'translated': translation.text,
             'pronunciation': translation.pronunciation, 
             'src_lang': translation.src,
-            'dest_lang': translation.dest
+            'dest_lang': translation.dest,
+            'suggestions': suggestions
         }
         
         return jsonify(response)
 
     except Exception as e:
-        print(f"Translation error: {e}")
-        import traceback
-        traceback.print_exc()
+        metrics.ERRORS.inc(source='translate')
+        log_event(logger, logging.ERROR, "Translation error", error=str(e), exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/translation/history', methods=['GET'])
 @login_required
+@http_cache.conditional(http_cache.TRANSLATIONS)
 def get_translation_history():
     """Get user's translation history"""
     try:
@@ -260,7 +347,7 @@ def get_translation_history():
         
         return jsonify(translations)
     except Exception as e:
-        print(f"Error fetching translation history: {e}")
+        log_event(logger, logging.ERROR, "Error fetching translation history", error=str(e))
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/quiz', methods=['POST'])
@@ -270,7 +357,22 @@ def generate_quiz():
         data = request.json
         target_lang = data.get('target', 'es')
 
-        response = quiz_service.generate_quiz_data(target_lang)
+        # Optional word filters; reject unknown values instead of failing generation
+        category = data.get('category') or None
+        if category is not None and category not in vocabulary.get_vocabulary().category_names():
+            return jsonify({'error': 'Unknown category'}), 400
+        difficulty = data.get('difficulty') or None
+        if difficulty is not None:
+            try:
+                difficulty = int(difficulty)
+            except (TypeError, ValueError):
+                difficulty = None
+            if difficulty not in vocabulary.DIFFICULTIES:
+                return jsonify({'error': 'Difficulty must be 1, 2 or 3'}), 400
+        if not quiz_service.has_words(category):
+            return jsonify({'error': 'Not enough words in this category'}), 400
+
+        response = quiz_service.generate_quiz_data(target_lang, category, difficulty)
         return jsonify(response)
 
     except Exception as e:
@@ -286,9 +388,11 @@ def submit_quiz():
         score = data.get('score')
         total_questions = data.get('total_questions')
         correct_answers = data.get('correct_answers')
+        if not translation_service.is_supported(language):
+            return jsonify({'error': 'Unsupported language'}), 400
         
         # Save quiz result
-        QuizResults.add_result(
+        saved = QuizResults.add_result(
             db,
             current_user.id,
             language,
@@ -296,15 +400,59 @@ def submit_quiz():
             total_questions,
             correct_answers
         )
+        if saved:
+            progress_service.record_quiz(db, current_user.id, language, total_questions, correct_answers)
         
         # Update stats
         points = correct_answers * 20
         UserStats.increment_stat(db, current_user.id, 'total_points', points)
+        leaderboard_service.record_points(
+            db, current_user.id, points,
+            language=language, username=current_user.username
+        )
+        streak_service.record_activity(db, current_user.id, data.get('timezone'))
         
         return jsonify({'success': True, 'points_earned': points})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/leaderboard', methods=['GET'])
+@login_required
+def get_leaderboard():
+    """Get a page of a leaderboard ('global', 'weekly' or a language code)"""
+    try:
+        board = request.args.get('board', 'global')
+        leaderboard_service.ensure_loaded(db)
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        entries = leaderboard_service.leaderboards.top(board, limit, offset)
+        return jsonify({'board': board, 'entries': entries})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leaderboard/rank', methods=['GET'])
+@login_required
+def get_leaderboard_rank():
+    """Get the current user's rank on a leaderboard"""
+    try:
+        board = request.args.get('board', 'global')
+        leaderboard_service.ensure_loaded(db)
+        rank = leaderboard_service.leaderboards.rank(current_user.id, board)
+        return jsonify({'board': board, 'rank': rank})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/daily', methods=['GET'])
+def get_daily_analytics():
+    """Daily usage rollups (see analytics_service.py); never reads the raw collections"""
+    if not analytics_service.can_read(request.headers.get('Authorization'), current_user):
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        days = request.args.get('days', 30, type=int)
+        return jsonify({'days': analytics_service.get_daily_rollups(db, days)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     print("Starting Polyglot Pal Server with Firebase...")
     print("Go to http://localhost:5000 to view the app")
@@ -0,0 +1,120 @@
+"""
+Structured, sampled logging.
+
+Records are formatted as one JSON object per line and handed to a queue; a
+background thread does the actual stdout write, so request threads never
+block on it. Hot-path events pass sampled=True and are only kept for a
+LOG_SAMPLE_RATE fraction of calls; warnings and errors are always kept.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """Drop most sampled records below WARNING"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False) and record.levelno < logging.WARNING:
+            return random.random() < self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, event and any fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler whose listener thread is (re)started in whichever process
+    emits, so it keeps working in gunicorn workers forked after import.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(self.queue, self.target)
+            listener.start()
+            self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # Leave JSON formatting to the listener thread; only resolve what can't cross it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        super().enqueue(record)
+
+
+def configure_logging():
+    """Install the JSON queue handler on the root logger (idempotent)"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+        handler = BackgroundHandler(stream)
+        handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(LOG_LEVEL)
+        _configured = True
+
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(name)
+
+
+def log_event(logger, level, event, sampled=False, exc_info=None, **fields):
+    """Log an event with structured fields; sampled=True for hot-path noise"""
+    logger.log(level, event, exc_info=exc_info, extra={'sampled': sampled, 'fields': fields})
@@ -0,0 +1,237 @@
+"""
+Static asset pipeline.
+
+Each asset (styles.css, speech-fix.js, hero-image.png) is read once per
+process, fingerprinted with a content hash and, for text types, compressed
+ahead of time with gzip and brotli. Templates link to the hashed URL through
+`asset_url()`, so those responses can be cached for a year as immutable;
+the plain names keep working but must revalidate. Asset requests open no
+session, so Flask-Login never loads the user for them.
+
+    python assets.py                     # write hashed + .gz/.br files to static_build/
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import threading
+from flask import Response, abort, request
+from flask.sessions import SecureCookieSessionInterface
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_FILES = ('styles.css', 'speech-fix.js', 'hero-image.png')
+ASSET_PREFIX = '/assets/'
+BUILD_DIR = os.path.join(ASSET_DIR, 'static_build')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Hashed URLs never change content; plain names must be revalidated (cheap with the ETag)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+
+
+class Asset:
+    """One fingerprinted file and its precompressed variants"""
+
+    __slots__ = ('name', 'hashed_name', 'mimetype', 'digest', 'mtime', 'variants')
+
+    def __init__(self, name, data, mtime):
+        self.name = name
+        self.mtime = mtime
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{self.digest}{ext}"
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.variants = {'identity': data}
+        if self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            self._add_variant('gzip', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._add_variant('br', brotli.compress(data, quality=11))
+
+    def _add_variant(self, encoding, body):
+        if len(body) < len(self.variants['identity']):
+            self.variants[encoding] = body
+
+    def etag(self, encoding):
+        # Each representation gets its own strong validator
+        return self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+
+    def etags(self):
+        return [self.etag(encoding) for encoding in self.variants]
+
+
+class AssetManifest:
+    """Maps plain and hashed asset names to their in-memory Asset"""
+
+    def __init__(self, directory=ASSET_DIR, names=ASSET_FILES):
+        self.directory = directory
+        self.names = names
+        self.auto_reload = False
+        self._assets = {}
+        self._hashed = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def _build(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        return Asset(name, data, os.path.getmtime(path))
+
+    def _store(self, asset):
+        previous = self._assets.get(asset.name)
+        if previous is not None:
+            self._hashed.pop(previous.hashed_name, None)
+        self._assets[asset.name] = asset
+        self._hashed[asset.hashed_name] = asset
+
+    def load(self):
+        """Fingerprint and compress every asset (idempotent)"""
+        with self._lock:
+            if self.loaded:
+                return
+            for name in self.names:
+                try:
+                    self._store(self._build(name))
+                except OSError:
+                    continue
+            self.loaded = True
+
+    def _fresh(self, asset):
+        if not self.auto_reload:
+            return asset
+        # Development: pick up edits without a restart
+        try:
+            mtime = os.path.getmtime(os.path.join(self.directory, asset.name))
+        except OSError:
+            return asset
+        if mtime == asset.mtime:
+            return asset
+        with self._lock:
+            asset = self._build(asset.name)
+            self._store(asset)
+        return asset
+
+    def get(self, name):
+        """Asset by its plain name, or None"""
+        self.load()
+        asset = self._assets.get(name)
+        return self._fresh(asset) if asset is not None else None
+
+    def get_hashed(self, hashed_name):
+        """Asset by its fingerprinted name, or None"""
+        self.load()
+        asset = self._hashed.get(hashed_name)
+        return self._fresh(asset) if asset is not None else None
+
+    def url(self, name):
+        """Fingerprinted URL for templates; unknown names fall back to the plain path"""
+        asset = self.get(name)
+        if asset is None:
+            return '/' + name
+        return ASSET_PREFIX + asset.hashed_name
+
+    def is_asset_path(self, path):
+        return path.startswith(ASSET_PREFIX) or path[1:] in self.names
+
+    def write_build(self, output_dir=BUILD_DIR):
+        """Write hashed files plus .gz/.br siblings and manifest.json for a CDN or proxy"""
+        self.load()
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = {}
+        for name, asset in sorted(self._assets.items()):
+            target = os.path.join(output_dir, asset.hashed_name)
+            for encoding, body in asset.variants.items():
+                suffix = {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+                with open(target + suffix, 'wb') as f:
+                    f.write(body)
+            manifest[name] = asset.hashed_name
+        with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+# Shared manifest used by app.py
+manifest = AssetManifest()
+
+
+def negotiate_encoding(asset):
+    """Best precompressed variant the client accepts"""
+    accepted = request.accept_encodings
+    for encoding in ENCODINGS:
+        if encoding in asset.variants and accepted[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def asset_response(asset, cache_control):
+    """Serve an asset with validators, honouring If-None-Match"""
+    encoding = negotiate_encoding(asset)
+    headers = {
+        'Cache-Control': cache_control,
+        'ETag': f'"{asset.etag(encoding)}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if any(request.if_none_match.contains(tag) for tag in asset.etags()):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    body = asset.variants[encoding]
+    if request.method == 'HEAD':
+        headers['Content-Length'] = str(len(body))
+        body = b''
+    return Response(body, mimetype=asset.mimetype, headers=headers)
+
+
+def serve_asset(hashed_name):
+    asset = manifest.get_hashed(hashed_name)
+    if asset is None:
+        abort(404)
+    return asset_response(asset, IMMUTABLE_CACHE_CONTROL)
+
+
+class AssetSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions, except that asset requests get a null session and no Set-Cookie"""
+
+    def open_session(self, app, request):
+        if manifest.is_asset_path(request.path):
+            return self.make_null_session(app)
+        return super().open_session(app, request)
+
+
+def init_app(app):
+    """Register the /assets/ route, the asset_url() template helper and the session bypass"""
+    manifest.auto_reload = app.debug or bool(app.config.get('TEMPLATES_AUTO_RELOAD'))
+    app.session_interface = AssetSessionInterface()
+    app.add_url_rule(ASSET_PREFIX + '<path:hashed_name>', 'asset', serve_asset)
+    app.jinja_env.globals['asset_url'] = manifest.url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write fingerprinted, precompressed static assets')
+    parser.add_argument('--output', default=BUILD_DIR, help='output directory (default: static_build/)')
+    args = parser.parse_args(argv)
+
+    built = manifest.write_build(args.output)
+    for name, hashed_name in built.items():
+        asset = manifest.get(name)
+        sizes = ', '.join(f"{encoding} {len(body)}" for encoding, body in asset.variants.items())
+        print(f"{name:<16} -> {hashed_name:<30} {sizes}")
+    if brotli is None:
+        print("brotli not installed; only gzip variants were written")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Local stand-ins for Firestore, Firebase Auth and the remote translator,
+used by benchmark.py so load tests run offline and reproducibly.
+Each fake can add a configurable latency (and error rate for the translator)
+to approximate the real round trips.
+"""
+import copy
+import itertools
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from firebase_admin import auth, firestore
+
+
+def _sleep(latency):
+    if latency:
+        time.sleep(latency)
+
+
+def _apply_value(current, value):
+    """Resolve Firestore transforms against the current field value"""
+    if isinstance(value, firestore.Increment):
+        return (current or 0) + value.value
+    if isinstance(value, firestore.ArrayUnion):
+        merged = list(current or [])
+        merged.extend(v for v in value.values if v not in merged)
+        return merged
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.now()
+    return copy.deepcopy(value)
+
+
+def _set_path(data, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    if value is firestore.DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = _apply_value(data.get(parts[-1]), value)
+
+
+def _get_path(data, path):
+    for part in path.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _merge(into, values):
+    for key, value in values.items():
+        if isinstance(value, dict) and isinstance(into.get(key), dict):
+            _merge(into[key], value)
+        else:
+            _set_path(into, key, value)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return _get_path(self._data or {}, field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollectionReference(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None):
+        self._db.pause('read')
+        with self._db.lock:
+            return FakeSnapshot(self, copy.deepcopy(self._db.docs.get(self.path)))
+
+    def _write(self, data, merge=False):
+        with self._db.lock:
+            current = self._db.docs.get(self.path)
+            if merge and current is not None:
+                _merge(current, data)
+            else:
+                fresh = {}
+                _merge(fresh, data)
+                self._db.docs[self.path] = fresh
+
+    def _update(self, data):
+        with self._db.lock:
+            current = self._db.docs.get(self.path)
+            if current is None:
+                raise KeyError(f"No document to update: {self.path}")
+            for key, value in data.items():
+                _set_path(current, key, value)
+
+    def set(self, data, merge=False):
+        self._db.pause('write')
+        self._write(data, merge)
+
+    def update(self, data):
+        self._db.pause('write')
+        self._update(data)
+
+    def delete(self):
+        self._db.pause('write')
+        with self._db.lock:
+            self._db.docs.pop(self.path, None)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), orders=(), limit_count=None, cursor=None, fields=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit_count=self._limit,
+                     cursor=self._cursor, fields=self._fields)
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, snapshot):
+        return self._copy(cursor=snapshot)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def _value(self, snapshot, field):
+        if field == '__name__':
+            return snapshot.id
+        return _get_path(snapshot._data, field)
+
+    def _matches(self, snapshot):
+        for field, op, expected in self._filters:
+            value = self._value(snapshot, field)
+            if op == '==' and value != expected:
+                return False
+            if op in ('>', '>=', '<', '<=') and value is None:
+                return False
+            if op == '>' and not value > expected:
+                return False
+            if op == '>=' and not value >= expected:
+                return False
+            if op == '<' and not value < expected:
+                return False
+            if op == '<=' and not value <= expected:
+                return False
+            if op == 'in' and value not in expected:
+                return False
+        return True
+
+    def stream(self):
+        self._collection._db.pause('query')
+        snapshots = [s for s in self._collection._all() if self._matches(s)]
+        for field, direction in reversed(self._orders):
+            snapshots.sort(key=lambda s: (self._value(s, field) is None, self._value(s, field)),
+                           reverse=str(direction).upper().endswith('DESCENDING'))
+        if self._cursor is not None:
+            keys = [s.id for s in snapshots]
+            if self._cursor.id in keys:
+                snapshots = snapshots[keys.index(self._cursor.id) + 1:]
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(self)
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._db, f"{self.path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def _all(self):
+        prefix = self.path + '/'
+        with self._db.lock:
+            items = [(path, copy.deepcopy(data)) for path, data in self._db.docs.items()
+                     if path.startswith(prefix) and '/' not in path[len(prefix):]]
+        return [FakeSnapshot(FakeDocumentReference(self._db, path), data) for path, data in sorted(items)]
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(('update', reference, data, None))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, None))
+
+    def commit(self):
+        self._db.pause('write')
+        for op, reference, data, merge in self._ops:
+            if op == 'set':
+                reference._write(data, merge)
+            elif op == 'update':
+                reference._update(data)
+            else:
+                with self._db.lock:
+                    self._db.docs.pop(reference.path, None)
+        self._ops = []
+
+
+class FakeFirestore:
+    """Dictionary-backed Firestore client supporting the calls this app makes"""
+
+    def __init__(self, read_latency=0.0, write_latency=0.0, query_latency=0.0):
+        self.docs = {}
+        self.lock = threading.RLock()
+        self.latency = {'read': read_latency, 'write': write_latency, 'query': query_latency}
+        self.calls = {'read': 0, 'write': 0, 'query': 0}
+
+    def pause(self, kind):
+        with self.lock:
+            self.calls[kind] += 1
+        _sleep(self.latency[kind])
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+
+class FakeUserRecord:
+    def __init__(self, uid, email, display_name):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+
+class FakeAuth:
+    """Stand-in for firebase_admin.auth with a fixed round-trip latency"""
+
+    EmailAlreadyExistsError = auth.EmailAlreadyExistsError
+    UserNotFoundError = auth.UserNotFoundError
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.users = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def create_user(self, email, password, display_name=None):
+        _sleep(self.latency)
+        with self._lock:
+            if email in self.users:
+                raise auth.EmailAlreadyExistsError(f"Email already exists: {email}", None, None)
+            record = FakeUserRecord(f"user{next(self._ids):08d}", email, display_name)
+            self.users[email] = record
+            return record
+
+    def get_user_by_email(self, email):
+        _sleep(self.latency)
+        if email not in self.users:
+            raise auth.UserNotFoundError(f"No user record found for {email}")
+        return self.users[email]
+
+    def delete_user(self, uid):
+        _sleep(self.latency)
+        with self._lock:
+            for email, record in list(self.users.items()):
+                if record.uid == uid:
+                    del self.users[email]
+
+
+class FakeTranslation:
+    def __init__(self, text, src, dest, pronunciation=None):
+        self.text = text
+        self.src = src
+        self.dest = dest
+        self.pronunciation = pronunciation
+
+
+class FakeTranslator:
+    """
+    Stand-in for googletrans.Translator.
+    Latency is drawn uniformly from latency * (1 +/- jitter); error_rate of
+    calls raise, like a throttled upstream would.
+    """
+
+    latency = 0.05
+    jitter = 0.3
+    error_rate = 0.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def translate(self, text, src='auto', dest='en'):
+        with FakeTranslator._lock:
+            FakeTranslator.calls += 1
+        if self.latency:
+            time.sleep(max(0.0, random.uniform(self.latency * (1 - self.jitter), self.latency * (1 + self.jitter))))
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError('Fake translator error')
+        return FakeTranslation(f"[{dest}] {text}", 'en' if src == 'auto' else src, dest)
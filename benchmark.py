@@ -0,0 +1,257 @@
+"""
+Load-test and micro-benchmark suite.
+
+Runs the Flask app in-process against bench_fakes (fake Firestore, Firebase
+Auth and translator with configurable latency/errors), drives each scenario
+from concurrent clients and reports p50/p95/p99 latency and requests per
+second. Results are written as JSON so two commits can be compared:
+
+    python benchmark.py                         # all scenarios, default settings
+    python benchmark.py --scenario translate --requests 500 --concurrency 16
+    python benchmark.py --compare bench_results/old.json bench_results/new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from werkzeug.security import generate_password_hash
+
+import bench_fakes
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_results')
+
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = 'bench-password'
+
+BATCH_TEXTS = [
+    'Good morning', 'Where is the train station?', 'I would like a coffee, please',
+    'How much does this cost?', 'Thank you very much', 'See you tomorrow',
+    'The weather is nice today', 'I am learning a new language',
+]
+
+
+def load_app(db, auth):
+    """Import app.py with Firebase and the translator replaced by the fakes"""
+    import clients
+    import firebase_models
+    clients.configure(db_factory=lambda: db, translator_factory=bench_fakes.FakeTranslator)
+    firebase_models.auth = auth
+
+    import app as app_module
+    app_module.warm_up()
+    return app_module.app
+
+
+def seed(db, auth):
+    """Create the benchmark user plus a little history"""
+    record = auth.create_user(email=BENCH_EMAIL, password=BENCH_PASSWORD, display_name='Bench User')
+    db.collection('users').document(record.uid).set({
+        'email': BENCH_EMAIL,
+        'username': 'Bench User',
+        'password_hash': generate_password_hash(BENCH_PASSWORD),
+        'created_at': datetime.now(),
+        'last_login': datetime.now()
+    })
+    db.collection('user_stats').document(record.uid).set({
+        'streak_days': 0, 'total_points': 0, 'words_learned': 0, 'quizzes_taken': 0,
+        'last_updated': datetime.now()
+    })
+    for i in range(20):
+        db.collection('translations').document().set({
+            'user_id': record.uid, 'source_text': f'text {i}', 'translated_text': f'texto {i}',
+            'source_lang': 'en', 'target_lang': 'es', 'timestamp': datetime.now()
+        })
+
+
+def login(client):
+    response = client.post('/login', data={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD})
+    if response.status_code not in (200, 302):
+        raise RuntimeError(f"Benchmark login failed: {response.status_code}")
+
+
+# Each scenario: (needs a logged-in client, callable(client, i) -> response list)
+def _translate(client, i):
+    return [client.post('/api/translate', json={'text': f'Hello number {i}', 'source': 'en', 'target': 'es'})]
+
+
+def _translate_batch(client, i):
+    # No batch endpoint exists; a batch is the page translating several phrases back to back
+    return [client.post('/api/translate', json={'text': text, 'source': 'auto', 'target': 'fr'})
+            for text in BATCH_TEXTS]
+
+
+def _quiz(client, i):
+    return [client.post('/api/quiz', json={'target': 'es'})]
+
+
+def _login(client, i):
+    return [client.post('/login', data={'email': BENCH_EMAIL, 'password': BENCH_PASSWORD})]
+
+
+def _signup(client, i):
+    email = f"signup-{uuid.uuid4().hex[:12]}@example.com"
+    return [client.post('/signup', data={'name': f'User {i}', 'email': email, 'password': BENCH_PASSWORD})]
+
+
+def _dashboard(client, i):
+    return [
+        client.get('/dashboard.html'),
+        client.get('/api/user/stats'),
+        client.get('/api/translation/history'),
+        client.get('/api/user/language-progress'),
+    ]
+
+
+def _assets(client, i):
+    import assets
+    return [client.get(assets.manifest.url(name), headers={'Accept-Encoding': 'gzip, br'})
+            for name in assets.ASSET_FILES]
+
+
+SCENARIOS = {
+    'translate': (True, _translate),
+    'translate_batch': (True, _translate_batch),
+    'quiz': (True, _quiz),
+    'login': (False, _login),
+    'signup': (False, _signup),
+    'dashboard': (True, _dashboard),
+    'assets': (True, _assets),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def run_scenario(app, name, requests, concurrency):
+    needs_login, operation = SCENARIOS[name]
+    local = threading.local()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client():
+        if getattr(local, 'client', None) is None:
+            local.client = app.test_client()
+            if needs_login:
+                login(local.client)
+        return local.client
+
+    def one(i):
+        c = client()
+        start = time.perf_counter()
+        responses = operation(c, i)
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for r in responses if r.status_code >= 400)
+        with lock:
+            latencies.append(elapsed)
+            errors[0] += failed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm-up: one op per worker so logins and caches settle before timing
+        list(pool.map(one, range(concurrency)))
+        latencies.clear()
+        errors[0] = 0
+
+        started = time.perf_counter()
+        list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'operations': len(latencies),
+        'errors': errors[0],
+        'ops_per_second': round(len(latencies) / wall, 2) if wall else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'scenario':<18}{'metric':<16}{old['commit']:>12}{new['commit']:>12}{'change':>10}")
+    for name in sorted(set(old['scenarios']) & set(new['scenarios'])):
+        for metric in ('ops_per_second', 'p50_ms', 'p95_ms', 'p99_ms'):
+            a = old['scenarios'][name][metric]
+            b = new['scenarios'][name][metric]
+            change = f"{(b - a) / a * 100:+.1f}%" if a else 'n/a'
+            print(f"{name:<18}{metric:<16}{a:>12}{b:>12}{change:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Polyglot Pal load tests against local fakes')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable; default: all)')
+    parser.add_argument('--requests', type=int, default=200, help='timed operations per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--translator-latency', type=float, default=0.05, help='fake translator latency (s)')
+    parser.add_argument('--translator-errors', type=float, default=0.0, help='fake translator error rate (0-1)')
+    parser.add_argument('--firestore-latency', type=float, default=0.01, help='fake Firestore round trip (s)')
+    parser.add_argument('--auth-latency', type=float, default=0.05, help='fake Firebase Auth round trip (s)')
+    parser.add_argument('--output', help='result file (default: bench_results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    bench_fakes.FakeTranslator.latency = args.translator_latency
+    bench_fakes.FakeTranslator.error_rate = args.translator_errors
+    db = bench_fakes.FakeFirestore(args.firestore_latency, args.firestore_latency, args.firestore_latency)
+    auth = bench_fakes.FakeAuth(args.auth_latency)
+    app = load_app(db, auth)
+    seed(db, auth)
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('compare', 'output')},
+        'scenarios': {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        calls_before = dict(db.calls)
+        translator_before = bench_fakes.FakeTranslator.calls
+        result = run_scenario(app, name, args.requests, args.concurrency)
+        result['firestore_calls'] = {k: db.calls[k] - calls_before[k] for k in db.calls}
+        result['translator_calls'] = bench_fakes.FakeTranslator.calls - translator_before
+        results['scenarios'][name] = result
+        print(f"{name:<18} {result['ops_per_second']:>9.1f} ops/s  "
+              f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+              f"p99 {result['p99_ms']:>8.2f} ms  errors {result['errors']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Lazily created, fork-aware clients for Firebase and the translator.
+
+Nothing here connects (or even imports firebase_admin/googletrans) until a
+client is first used, so importing app.py stays cheap. Clients remember the
+process that created them; a forked gunicorn worker never reuses the
+master's gRPC/HTTP connections and builds its own on first use (or in the
+warm-up hook).
+"""
+import importlib
+import json
+import logging
+import os
+import threading
+from app_logging import get_logger, log_event
+
+logger = get_logger(__name__)
+
+_lock = threading.RLock()
+_db = None
+_db_pid = None
+_translator = None
+_translator_pid = None
+
+# Overridable for tests and benchmarks: callables returning a client
+_db_factory = None
+_translator_factory = None
+
+
+class LazyModule:
+    """Module proxy that performs the import on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def load_credentials():
+    """
+    Firebase credentials: JSON content in FIREBASE_CREDENTIALS (Render/Cloud)
+    or a file path in FIREBASE_CREDENTIALS_PATH (local).
+    """
+    firebase_creds = os.getenv('FIREBASE_CREDENTIALS')
+    if firebase_creds:
+        try:
+            return json.loads(firebase_creds)
+        except json.JSONDecodeError as e:
+            log_event(logger, logging.ERROR, "Error parsing FIREBASE_CREDENTIALS", error=str(e))
+    return os.getenv('FIREBASE_CREDENTIALS_PATH', 'firebase-credentials.json')
+
+
+def _default_db():
+    from firebase_models import initialize_firebase
+    return initialize_firebase(load_credentials())
+
+
+def _default_translator():
+    from googletrans import Translator
+    return Translator()
+
+
+def configure(db_factory=None, translator_factory=None):
+    """Swap in client factories (e.g. local fakes) and drop existing clients"""
+    global _db_factory, _translator_factory
+    with _lock:
+        _db_factory = db_factory
+        _translator_factory = translator_factory
+        _reset_locked()
+
+
+def get_db():
+    """The process's Firestore client, created on first use"""
+    global _db, _db_pid
+    db = _db
+    if db is not None and _db_pid == os.getpid():
+        return db
+    with _lock:
+        if _db is None or _db_pid != os.getpid():
+            _db = (_db_factory or _default_db)()
+            _db_pid = os.getpid()
+            log_event(logger, logging.INFO, "Firestore client ready", pid=_db_pid)
+        return _db
+
+
+def new_translator():
+    """A fresh translator (translate_text builds one per request)"""
+    return (_translator_factory or _default_translator)()
+
+
+def get_translator():
+    """The process's shared translator, created on first use"""
+    global _translator, _translator_pid
+    translator = _translator
+    if translator is not None and _translator_pid == os.getpid():
+        return translator
+    with _lock:
+        if _translator is None or _translator_pid != os.getpid():
+            _translator = new_translator()
+            _translator_pid = os.getpid()
+        return _translator
+
+
+def _reset_locked():
+    global _db, _db_pid, _translator, _translator_pid
+    if _db is not None and _db_pid != os.getpid() and _db_factory is None:
+        # Inherited from the parent: forget the Firebase app so this process can create its own
+        try:
+            import firebase_admin
+            firebase_admin.delete_app(firebase_admin.get_app())
+        except (ImportError, ValueError):
+            pass
+    _db = _db_pid = None
+    _translator = _translator_pid = None
+
+
+def reset_after_fork():
+    """Called in each gunicorn worker right after fork"""
+    with _lock:
+        _reset_locked()
+
+
+class LazyDB:
+    """Stand-in for the Firestore client that resolves it per process on use"""
+
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
+
+
+db = LazyDB()
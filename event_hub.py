@@ -0,0 +1,269 @@
+"""
+Per-user server-sent event streams.
+
+Model write paths publish small deltas (a new history entry, stat
+increments) and every open stream of that user receives them, so pages no
+longer re-poll after each action. The hub runs a single asyncio loop on a
+background thread; each stream is a coroutine with a small bounded queue.
+
+With EVENTS_PORT set, that loop also serves GET /api/events itself, so
+thousands of idle streams cost a coroutine each instead of a worker; route
+/api/events to that port in the proxy. Without it, the Flask /api/events
+route streams from the same hub with one thread per stream. Those threads
+come out of the worker's request threads, so the route holds at most
+`wsgi_slots` streams at once and answers 503 beyond that; gunicorn.conf.py
+sizes it from the worker. Pages only open a stream when
+`streaming_available()` says one can be served, and re-fetch otherwise.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+from app_logging import get_logger, log_event
+
+logger = get_logger(__name__)
+
+EVENTS_HOST = os.getenv('EVENTS_HOST', '0.0.0.0')
+EVENTS_PORT = int(os.getenv('EVENTS_PORT', '0'))
+EVENTS_PATH = '/api/events'
+
+# Comment line sent on idle streams so proxies keep them open
+HEARTBEAT_INTERVAL = 15
+
+# Undelivered events per stream before it is told to resync instead
+MAX_PENDING = 64
+
+# Largest request head the event server will read
+MAX_REQUEST_HEAD = 8192
+
+# Streams the Flask route may hold open at once without EVENTS_PORT
+WSGI_STREAM_SLOTS = int(os.getenv('EVENTS_WSGI_STREAMS', '4'))
+
+STREAM_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: keep-alive\r\n"
+    b"X-Accel-Buffering: no\r\n\r\n"
+)
+
+
+def format_event(event, data):
+    """One SSE message as bytes"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8')
+
+
+RESYNC = format_event('resync', {})
+HEARTBEAT = b": ping\n\n"
+
+
+class _Subscriber:
+    __slots__ = ('queue',)
+
+    def __init__(self):
+        self.queue = asyncio.Queue(MAX_PENDING)
+
+    def put(self, payload):
+        if self.queue.full():
+            # A slow reader: drop the backlog and have the page reload once
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            payload = RESYNC
+        self.queue.put_nowait(payload)
+
+
+class _WsgiStream:
+    """Iterator over one WSGI stream; closing it gives its slot back"""
+
+    def __init__(self, hub, events):
+        self._hub = hub
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._events.close()
+        finally:
+            self._hub._release_wsgi_slot()
+
+
+class EventHub:
+    """Fan-out of per-user events to open streams"""
+
+    def __init__(self, wsgi_slots=WSGI_STREAM_SLOTS):
+        self._subscribers = {}
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # False when another process may write a user's data (several workers)
+        self.enabled = True
+        self.wsgi_slots = wsgi_slots
+        self._wsgi_open = 0
+
+    def _ensure_loop(self):
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                # Fresh loop per process; a forked worker starts without subscribers
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='event-hub', daemon=True)
+                thread.start()
+                self._subscribers = {}
+                self._loop = loop
+                self._pid = os.getpid()
+            return self._loop
+
+    def subscriber_count(self, user_id=None):
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_id, event, data):
+        """Send an event to the user's open streams (thread-safe, no-op if there are none)"""
+        if user_id not in self._subscribers or self._pid != os.getpid():
+            return
+        self._loop.call_soon_threadsafe(self._fan_out, user_id, format_event(event, data))
+
+    def _fan_out(self, user_id, payload):
+        for subscriber in self._subscribers.get(user_id, ()):
+            subscriber.put(payload)
+
+    async def stream(self, user_id):
+        """Async generator of SSE chunks for one connection (runs on the hub loop)"""
+        subscriber = _Subscriber()
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        try:
+            yield b"retry: 5000\n\n" + format_event('ready', {})
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def streaming_available(self):
+        """Whether pages should open a stream: the event server runs or the route has slots"""
+        return self.enabled and (bool(EVENTS_PORT) or self.wsgi_slots > 0)
+
+    def open_wsgi_stream(self, user_id):
+        """Stream for the Flask route, or None when every slot is taken"""
+        with self._lock:
+            if not self.enabled or self._wsgi_open >= self.wsgi_slots:
+                return None
+            self._wsgi_open += 1
+        return _WsgiStream(self, self.iter_events(user_id))
+
+    def _release_wsgi_slot(self):
+        with self._lock:
+            self._wsgi_open -= 1
+
+    def iter_events(self, user_id):
+        """Blocking iterator over stream() for the WSGI fallback route"""
+        loop = self._ensure_loop()
+        stream = self.stream(user_id)
+        try:
+            while True:
+                yield asyncio.run_coroutine_threadsafe(stream.__anext__(), loop).result()
+        finally:
+            asyncio.run_coroutine_threadsafe(stream.aclose(), loop).result(timeout=5)
+
+    async def _pump(self, user_id, writer):
+        stream = self.stream(user_id)
+        try:
+            async for chunk in stream:
+                writer.write(chunk)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            await stream.aclose()
+
+    async def _handle(self, reader, writer, authenticate):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            for line in header_lines:
+                name, sep, value = line.partition(':')
+                if sep:
+                    headers[name.strip().lower()] = value.strip()
+
+            if method != 'GET' or target.split('?', 1)[0] != EVENTS_PATH:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            # May read the users document; keep it off the loop
+            user_id = await asyncio.get_running_loop().run_in_executor(
+                None, authenticate, headers.get('cookie', ''))
+            if user_id is None:
+                writer.write(b"HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+
+            writer.write(STREAM_HEADERS)
+            pump = asyncio.ensure_future(self._pump(user_id, writer))
+            # The client sends nothing after the request; EOF means it went away
+            hangup = asyncio.ensure_future(reader.read(1))
+            await asyncio.wait((pump, hangup), return_when=asyncio.FIRST_COMPLETED)
+            pump.cancel()
+            hangup.cancel()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def serve(self, authenticate, host=EVENTS_HOST, port=EVENTS_PORT):
+        """Serve GET /api/events on the hub loop; authenticate(cookie_header) -> user id or None"""
+        loop = self._ensure_loop()
+
+        async def start():
+            return await asyncio.start_server(
+                lambda reader, writer: self._handle(reader, writer, authenticate),
+                host, port, limit=MAX_REQUEST_HEAD)
+
+        server = asyncio.run_coroutine_threadsafe(start(), loop).result()
+        log_event(logger, logging.INFO, "Event stream server listening", host=host, port=port, pid=os.getpid())
+        return server
+
+
+def session_authenticator(app, accept):
+    """
+    User id from a Flask-Login session cookie. accept(session) -> user id or
+    None applies the app's own session checks (identity.session_user_id).
+    """
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie_name = app.config['SESSION_COOKIE_NAME']
+    max_age = int(app.permanent_session_lifetime.total_seconds())
+
+    def authenticate(cookie_header):
+        value = parse_cookie(cookie_header).get(cookie_name)
+        if not value or serializer is None:
+            return None
+        try:
+            data = serializer.loads(value, max_age=max_age)
+        except BadSignature:
+            return None
+        return accept(data)
+
+    return authenticate
+
+
+# Shared hub; firebase_models and streak_service publish to it
+hub = EventHub()
@@ -1,7 +1,55 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+import logging
+import os
+import threading
+import event_hub
+import http_cache
+import metrics
+import translation_memory
+from app_logging import get_logger, log_event
+from clients import lazy_module
+
+# firebase_admin is only imported when a client is first created
+firebase_admin = lazy_module('firebase_admin')
+credentials = lazy_module('firebase_admin.credentials')
+firestore = lazy_module('firebase_admin.firestore')
+auth = lazy_module('firebase_admin.auth')
+
+logger = get_logger(__name__)
+
+# Firestore limits a write batch to 500 operations
+MAX_BATCH_WRITES = 500
+
+
+def _log_error(message, error, exc_info=False):
+    """Log a failed Firestore call and count it"""
+    metrics.ERRORS.inc(source='firestore')
+    http_cache.mark_uncacheable()
+    log_event(logger, logging.ERROR, message, error=str(error), exc_info=exc_info)
+
+
+def _timed(call):
+    """Record a model method's Firestore latency under its name"""
+    return metrics.timed(metrics.FIRESTORE_LATENCY, call=call)
+
+
+# Password hashing is CPU-bound (scrypt, which releases the GIL); signup runs
+# it on this pool while the Firebase Auth call is in flight
+HASH_WORKERS = 2
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_lock = threading.Lock()
+
+
+def _hash_executor():
+    global _hash_pool, _hash_pool_pid
+    with _hash_pool_lock:
+        if _hash_pool is None or _hash_pool_pid != os.getpid():
+            _hash_pool = ThreadPoolExecutor(HASH_WORKERS, thread_name_prefix='password-hash')
+            _hash_pool_pid = os.getpid()
+        return _hash_pool
 
 # Initialize Firebase (will be called from app.py)
 def initialize_firebase(cred_path):
@@ -13,25 +61,36 @@ def initialize_firebase(cred_path):
 class FirebaseUser:
     """User model for Firebase Firestore"""
     
-    def __init__(self, user_id, email, username, created_at=None):
+    # Built on every request (usually from the session claim, see identity.py), so kept small
+    __slots__ = ('id', 'email', 'username', 'created_at', 'session_version')
+    
+    # Required by Flask-Login; a FirebaseUser is always a signed-in, active account
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+    
+    def __init__(self, user_id, email, username, created_at=None, session_version=0):
         self.id = user_id
         self.email = email
         self.username = username
         self.created_at = created_at or datetime.now()
-        self.is_authenticated = True
-        self.is_active = True
-        self.is_anonymous = False
+        self.session_version = session_version
     
     def get_id(self):
         """Required for Flask-Login"""
         return self.id
     
     @staticmethod
+    @_timed('FirebaseUser.create_user')
     def create_user(db, email, username, password):
-        """Create a new user in Firebase"""
+        """
+        Create a new user in Firebase.
+        Firebase Auth enforces unique emails: auth.EmailAlreadyExistsError is
+        raised to the caller rather than checked with a separate query.
+        """
         try:
-            # Hash the password
-            password_hash = generate_password_hash(password)
+            # Hash the password off the request thread, overlapping the Auth call
+            password_hash = _hash_executor().submit(generate_password_hash, password)
             
             # Create user in Firebase Auth
             user_record = auth.create_user(
@@ -39,34 +98,44 @@ class FirebaseUser:
                 password=password,
                 display_name=username
             )
-            
-            # Store additional user data in Firestore with hashed password
-            user_ref = db.collection('users').document(user_record.uid)
-            user_data = {
+        except auth.EmailAlreadyExistsError:
+            raise
+        except Exception as e:
+            _log_error("Error creating user", e)
+            return None
+        
+        try:
+            # User document (with hashed password) and initial stats in one atomic batch
+            now = datetime.now()
+            batch = db.batch()
+            batch.set(db.collection('users').document(user_record.uid), {
                 'email': email,
                 'username': username,
-                'password_hash': password_hash,  # Store hashed password
-                'created_at': datetime.now(),
-                'last_login': datetime.now()
-            }
-            user_ref.set(user_data)
-            
-            # Initialize user stats
-            stats_ref = db.collection('user_stats').document(user_record.uid)
-            stats_ref.set({
+                'password_hash': password_hash.result(),
+                'created_at': now,
+                'last_login': now
+            })
+            batch.set(db.collection('user_stats').document(user_record.uid), {
                 'streak_days': 0,
                 'total_points': 0,
                 'words_learned': 0,
                 'quizzes_taken': 0,
-                'last_updated': datetime.now()
+                'last_updated': now
             })
+            batch.commit()
             
             return FirebaseUser(user_record.uid, email, username)
         except Exception as e:
-            print(f"Error creating user: {e}")
+            _log_error("Error creating user", e)
+            # Don't leave an Auth account without its documents (it would block the email)
+            try:
+                auth.delete_user(user_record.uid)
+            except Exception as cleanup_error:
+                _log_error("Error removing Auth user after failed signup", cleanup_error)
             return None
     
     @staticmethod
+    @_timed('FirebaseUser.get_by_email')
     def get_by_email(db, email):
         """Get user by email"""
         try:
@@ -81,14 +150,16 @@ class FirebaseUser:
                     doc.id,
                     data['email'],
                     data['username'],
-                    data.get('created_at')
+                    data.get('created_at'),
+                    data.get('session_version', 0)
                 )
             return None
         except Exception as e:
-            print(f"Error getting user: {e}")
+            _log_error("Error getting user", e)
             return None
     
     @staticmethod
+    @_timed('FirebaseUser.get_by_id')
     def get_by_id(db, user_id):
         """Get user by ID"""
         try:
@@ -101,14 +172,16 @@ class FirebaseUser:
                     doc.id,
                     data['email'],
                     data['username'],
-                    data.get('created_at')
+                    data.get('created_at'),
+                    data.get('session_version', 0)
                 )
             return None
         except Exception as e:
-            print(f"Error getting user by ID: {e}")
+            _log_error("Error getting user by ID", e)
             return None
     
     @staticmethod
+    @_timed('FirebaseUser.verify_password')
     def verify_password(db, email, password):
         """Verify user password by checking hash in Firestore"""
         try:
@@ -125,28 +198,30 @@ class FirebaseUser:
                     # Verify password using werkzeug
                     return check_password_hash(password_hash, password)
                 else:
-                    print(f"No password hash found for user: {email}")
+                    log_event(logger, logging.WARNING, "No password hash found for user", email=email)
                     return False
             
             # User not found
             return False
         except Exception as e:
-            print(f"Error verifying password: {e}")
+            _log_error("Error verifying password", e)
             return False
     
+    @_timed('FirebaseUser.update_last_login')
     def update_last_login(self, db):
         """Update user's last login timestamp"""
         try:
             user_ref = db.collection('users').document(self.id)
             user_ref.update({'last_login': datetime.now()})
         except Exception as e:
-            print(f"Error updating last login: {e}")
+            _log_error("Error updating last login", e)
 
 
 class UserStats:
     """User statistics model"""
     
     @staticmethod
+    @_timed('UserStats.get_stats')
     def get_stats(db, user_id):
         """Get user statistics"""
         try:
@@ -167,22 +242,27 @@ class UserStats:
                 stats_ref.set(default_stats)
                 return default_stats
         except Exception as e:
-            print(f"Error getting stats: {e}")
+            _log_error("Error getting stats", e)
             return None
     
     @staticmethod
+    @_timed('UserStats.update_stats')
     def update_stats(db, user_id, stats_data):
         """Update user statistics"""
         try:
             stats_ref = db.collection('user_stats').document(user_id)
             stats_data['last_updated'] = datetime.now()
             stats_ref.update(stats_data)
+            event_hub.hub.publish(user_id, 'stats', {
+                'set': {k: v for k, v in stats_data.items() if k != 'last_updated'}
+            })
             return True
         except Exception as e:
-            print(f"Error updating stats: {e}")
+            _log_error("Error updating stats", e)
             return False
     
     @staticmethod
+    @_timed('UserStats.increment_stat')
     def increment_stat(db, user_id, stat_name, increment=1):
         """Increment a specific stat"""
         try:
@@ -191,9 +271,10 @@ class UserStats:
                 stat_name: firestore.Increment(increment),
                 'last_updated': datetime.now()
             })
+            event_hub.hub.publish(user_id, 'stats', {'increment': {stat_name: increment}})
             return True
         except Exception as e:
-            print(f"Error incrementing stat: {e}")
+            _log_error("Error incrementing stat", e)
             return False
 
 
@@ -201,24 +282,31 @@ class TranslationHistory:
     """Translation history model"""
     
     @staticmethod
+    @_timed('TranslationHistory.add_translation')
     def add_translation(db, user_id, source_text, translated_text, source_lang, target_lang):
         """Add a translation to history"""
         try:
             translation_ref = db.collection('translations').document()
-            translation_ref.set({
+            entry = {
                 'user_id': user_id,
                 'source_text': source_text,
                 'translated_text': translated_text,
                 'source_lang': source_lang,
                 'target_lang': target_lang,
                 'timestamp': datetime.now()
-            })
+            }
+            translation_ref.set(entry)
+            http_cache.versions.bump(user_id, http_cache.TRANSLATIONS)
+            translation_memory.memory.add(source_text, translated_text, source_lang, target_lang, owner=user_id)
+            event_hub.hub.publish(user_id, 'history', dict(
+                entry, id=translation_ref.id, timestamp=entry['timestamp'].isoformat()))
             return True
         except Exception as e:
-            print(f"Error adding translation: {e}")
+            _log_error("Error adding translation", e)
             return False
     
     @staticmethod
+    @_timed('TranslationHistory.get_user_translations')
     def get_user_translations(db, user_id, limit=10):
         """Get user's recent translations"""
         try:
@@ -237,9 +325,7 @@ class TranslationHistory:
             # Return only the requested limit
             return translations[:limit]
         except Exception as e:
-            print(f"Error getting translations: {e}")
-            import traceback
-            traceback.print_exc()
+            _log_error("Error getting translations", e, exc_info=True)
             return []
 
 
@@ -247,28 +333,34 @@ class QuizResults:
     """Quiz results model"""
     
     @staticmethod
+    @_timed('QuizResults.add_result')
     def add_result(db, user_id, language, score, total_questions, correct_answers):
         """Add a quiz result"""
         try:
             quiz_ref = db.collection('quiz_results').document()
-            quiz_ref.set({
+            result = {
                 'user_id': user_id,
                 'language': language,
                 'score': score,
                 'total_questions': total_questions,
                 'correct_answers': correct_answers,
                 'timestamp': datetime.now()
-            })
+            }
+            quiz_ref.set(result)
+            http_cache.versions.bump(user_id, http_cache.QUIZ_RESULTS)
+            event_hub.hub.publish(user_id, 'quiz', dict(
+                result, id=quiz_ref.id, timestamp=result['timestamp'].isoformat()))
             
             # Increment quizzes taken stat
             UserStats.increment_stat(db, user_id, 'quizzes_taken')
             
             return True
         except Exception as e:
-            print(f"Error adding quiz result: {e}")
+            _log_error("Error adding quiz result", e)
             return False
     
     @staticmethod
+    @_timed('QuizResults.get_user_results')
     def get_user_results(db, user_id, limit=10):
         """Get user's recent quiz results"""
         try:
@@ -285,32 +377,76 @@ class QuizResults:
             
             return results
         except Exception as e:
-            print(f"Error getting quiz results: {e}")
+            _log_error("Error getting quiz results", e)
             return []
 
 
 class LanguageProgress:
     """Language progress tracking"""
-    
+
+    # Words learned for 100% progress in a language
+    GOAL_WORDS = 1000
+
+    # Counter fields kept per language (see progress_service.py)
+    COUNTERS = ('words_learned', 'translations', 'quizzes', 'quiz_questions', 'quiz_correct')
+
     @staticmethod
+    def progress_percent(words_learned):
+        return min(100, int(100 * (words_learned or 0) / LanguageProgress.GOAL_WORDS))
+
+    @staticmethod
+    def _ref(db, user_id, language_code):
+        return db.collection('language_progress').document(user_id)\
+                 .collection('languages').document(language_code)
+
+    @staticmethod
+    @_timed('LanguageProgress.apply_updates')
+    def apply_updates(db, updates, replace=False):
+        """
+        Write {(user_id, language_code): {counter: value, 'last_practiced': datetime}}
+        in batches. Counters are added to the stored values, or overwrite
+        them when replace is set (backfill).
+        """
+        batch = db.batch()
+        pending = 0
+        for (user_id, language_code), values in updates.items():
+            fields = {name: value if replace else firestore.Increment(value)
+                      for name, value in values.items() if name in LanguageProgress.COUNTERS}
+            if values.get('last_practiced') is not None:
+                fields['last_practiced'] = values['last_practiced']
+            batch.set(LanguageProgress._ref(db, user_id, language_code), fields, merge=not replace)
+            pending += 1
+            if pending >= MAX_BATCH_WRITES:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+        for user_id in {user_id for user_id, _ in updates}:
+            http_cache.versions.bump(user_id, http_cache.LANGUAGE_PROGRESS)
+            event_hub.hub.publish(user_id, 'progress', {})
+
+    @staticmethod
+    @_timed('LanguageProgress.update_progress')
     def update_progress(db, user_id, language_code, progress_percent, words_learned=0):
         """Update progress for a specific language"""
         try:
-            progress_ref = db.collection('language_progress').document(user_id)\
-                            .collection('languages').document(language_code)
-            
+            progress_ref = LanguageProgress._ref(db, user_id, language_code)
+
             progress_ref.set({
                 'progress_percent': progress_percent,
                 'words_learned': words_learned,
                 'last_practiced': datetime.now()
             }, merge=True)
+            http_cache.versions.bump(user_id, http_cache.LANGUAGE_PROGRESS)
             
             return True
         except Exception as e:
-            print(f"Error updating language progress: {e}")
+            _log_error("Error updating language progress", e)
             return False
     
     @staticmethod
+    @_timed('LanguageProgress.get_all_progress')
     def get_all_progress(db, user_id):
         """Get progress for all languages"""
         try:
@@ -319,9 +455,12 @@ class LanguageProgress:
             
             progress_data = {}
             for doc in progress_ref.stream():
-                progress_data[doc.id] = doc.to_dict()
+                data = doc.to_dict()
+                if 'progress_percent' not in data:
+                    data['progress_percent'] = LanguageProgress.progress_percent(data.get('words_learned'))
+                progress_data[doc.id] = data
             
             return progress_data
         except Exception as e:
-            print(f"Error getting language progress: {e}")
+            _log_error("Error getting language progress", e)
             return {}
@@ -0,0 +1,54 @@
+import os
+import clients
+import metrics
+
+# Import app.py once in the master; workers fork with it already loaded.
+# Clients are lazy, so no Firebase/translator connection exists before the fork.
+preload_app = True
+
+# A single worker process unless WEB_CONCURRENCY says otherwise. Leaderboards, the
+# translation memory, event streams and http_cache's data versions live in the
+# serving process and only see its own writes. With more workers, post_worker_init
+# turns off event streams, conditional responses and leaderboard snapshots: pages
+# re-fetch, every GET is answered in full, and each worker's boards show the last
+# snapshot plus only the points it recorded itself, which are never saved. Go back
+# to one worker and run `python leaderboard_service.py seed` to rebuild the global
+# board from user_stats.
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# Threaded workers: a Flask /api/events stream holds a thread, not the whole worker
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# Request threads kept free of event streams in each worker
+RESERVED_THREADS = 4
+
+
+def on_starting(server):
+    """Start each deploy with empty per-worker metric snapshots"""
+    metrics.clear_snapshots()
+
+
+def post_fork(server, worker):
+    """Never share the master's connections with a worker"""
+    clients.reset_after_fork()
+
+
+def post_worker_init(worker):
+    """Match per-process state to the worker setup, then connect and load models before accepting requests"""
+    import app
+    import event_hub
+    import http_cache
+    import leaderboard_service
+    from gunicorn.workers.gthread import ThreadWorker
+
+    if worker.cfg.workers > 1:
+        # Per-process state can't see other workers' writes (see the top of this file)
+        event_hub.hub.enabled = False
+        http_cache.versions.enabled = False
+        leaderboard_service.leaderboards.snapshots_enabled = False
+    elif isinstance(worker, ThreadWorker):
+        event_hub.hub.wsgi_slots = max(0, worker.cfg.threads - RESERVED_THREADS)
+    else:
+        event_hub.hub.wsgi_slots = 0
+    app.warm_up()
@@ -0,0 +1,170 @@
+"""
+Conditional GET and response compression for the JSON API.
+
+Writes to a user's translations, quiz results or language progress bump an
+in-memory version for that (user, dataset). Read endpoints wrapped in
+`conditional(dataset)` answer If-None-Match / If-Modified-Since from that
+version alone, so an unchanged dataset returns 304 without touching
+Firestore. A user the process hasn't seen yet gets a fresh version and
+one full response. Versions only see this process's writes, so with more
+than one worker `versions.enabled` is off and responses carry no validators.
+
+JSON bodies above COMPRESS_MIN_SIZE are gzip/brotli encoded when the client
+accepts it.
+"""
+import functools
+import gzip
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import g, has_request_context, make_response, request
+from flask_login import current_user
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+TRANSLATIONS = 'translations'
+QUIZ_RESULTS = 'quiz_results'
+LANGUAGE_PROGRESS = 'language_progress'
+
+# Users whose dataset versions are kept in memory
+VERSION_CACHE_SIZE = 10000
+
+# JSON bodies smaller than this are sent as-is
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+
+# Per-user data: browsers may keep it but must revalidate, shared caches must not
+API_CACHE_CONTROL = 'private, no-cache'
+
+
+class DataVersions:
+    """LRU map of (user_id, dataset) -> (version token, last modified)"""
+
+    def __init__(self, size=VERSION_CACHE_SIZE):
+        self.size = size
+        # Cleared by gunicorn.conf.py when other workers can write the same data
+        self.enabled = True
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_version(self):
+        # HTTP dates have one-second resolution
+        return secrets.token_hex(6), datetime.now(timezone.utc).replace(microsecond=0)
+
+    def _store(self, key, version):
+        self._versions[key] = version
+        self._versions.move_to_end(key)
+        while len(self._versions) > self.size:
+            self._versions.popitem(last=False)
+
+    def current(self, user_id, dataset):
+        """Version of a user's dataset; unknown datasets get a new one"""
+        key = (user_id, dataset)
+        with self._lock:
+            version = self._versions.get(key)
+            if version is None:
+                version = self._new_version()
+            self._store(key, version)
+            return version
+
+    def bump(self, user_id, *datasets):
+        """Mark datasets as changed after a successful write"""
+        with self._lock:
+            for dataset in datasets:
+                key = (user_id, dataset)
+                token, last_modified = self._new_version()
+                previous = self._versions.get(key)
+                if previous is not None and last_modified <= previous[1]:
+                    # Two writes within one second must still move Last-Modified forward
+                    last_modified = previous[1] + timedelta(seconds=1)
+                self._store(key, (token, last_modified))
+
+
+# Shared instance; firebase_models bumps it on writes
+versions = DataVersions()
+
+
+def mark_uncacheable():
+    """Keep validators off this response (a read failed and returned a fallback)"""
+    if has_request_context():
+        g.uncacheable = True
+
+
+def _is_fresh(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(dataset):
+    """
+    Decorator for a login-protected GET endpoint returning one user dataset.
+    Must sit below @login_required.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not versions.enabled:
+                return view(*args, **kwargs)
+            # Read the version before the data so a concurrent write can only make it stale
+            token, last_modified = versions.current(current_user.id, dataset)
+            etag = f"{token}-{request.query_string.decode('latin-1')}"
+            if _is_fresh(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.pop('uncacheable', False):
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = API_CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] > 0:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """after_request hook: compress JSON bodies above COMPRESS_MIN_SIZE"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        # Low quality levels: most of the size win for a fraction of the CPU
+        compressed = brotli.compress(body, quality=4)
+    else:
+        compressed = gzip.compress(body, compresslevel=6)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A strong validator names exact bytes; the encoded body is a different representation
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,141 @@
+"""
+Signed identity claims in the session.
+
+At login the session gets a compact claim [id, username, email, version,
+issued_at] next to Flask-Login's user id. The session cookie is already
+signed with SECRET_KEY, so load_user rebuilds FirebaseUser from the claim
+without a Firestore read. The users document is read only when the claim
+is older than IDENTITY_CLAIM_TTL or its version has been revoked in this
+process; a claim below the stored `session_version`, or a login without a
+claim, ends the session.
+
+Revocations recorded here are seen at once by this process and by others
+within IDENTITY_CLAIM_TTL. Set IDENTITY_CLAIMS=0 to load the user from
+Firestore on every request, as before.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import session
+from flask_login.config import SESSION_KEYS
+from app_logging import get_logger, log_event
+from clients import lazy_module
+from firebase_models import FirebaseUser
+
+firestore = lazy_module('firebase_admin.firestore')
+
+logger = get_logger(__name__)
+
+ENABLED = os.getenv('IDENTITY_CLAIMS', '1') != '0'
+
+# Seconds a claim is trusted before the users document is checked again
+CLAIM_TTL = int(os.getenv('IDENTITY_CLAIM_TTL', '900'))
+
+SESSION_KEY = '_identity'
+
+# Users whose minimum accepted session version is kept in memory
+REVOCATION_CACHE_SIZE = 10000
+
+_min_versions = OrderedDict()
+_min_versions_lock = threading.Lock()
+
+
+def _min_version(user_id):
+    with _min_versions_lock:
+        return _min_versions.get(user_id, 0)
+
+
+def _set_min_version(user_id, version):
+    with _min_versions_lock:
+        _min_versions[user_id] = max(version, _min_versions.get(user_id, 0))
+        _min_versions.move_to_end(user_id)
+        while len(_min_versions) > REVOCATION_CACHE_SIZE:
+            _min_versions.popitem(last=False)
+
+
+def issue(user, now=None):
+    """Put the user's claim in the session (after login_user)"""
+    if ENABLED:
+        session[SESSION_KEY] = [user.id, user.username, user.email, user.session_version,
+                                int(now if now is not None else time.time())]
+
+
+def clear():
+    session.pop(SESSION_KEY, None)
+
+
+def _claim_user(claim, user_id, now=None):
+    if not claim or len(claim) != 5 or claim[0] != user_id:
+        return None
+    _, username, email, version, issued_at = claim
+    if (now if now is not None else time.time()) - issued_at > CLAIM_TTL:
+        return None
+    if version < _min_version(user_id):
+        return None
+    return FirebaseUser(user_id, email, username, session_version=version)
+
+
+def from_claim(user_id, now=None):
+    """FirebaseUser from a fresh, unrevoked claim for user_id, else None"""
+    return _claim_user(session.get(SESSION_KEY), user_id, now)
+
+
+def _stored_user(db, user_id, claim):
+    """
+    The users document for a session whose claim can't be trusted on its
+    own, or None when the session must end. Every login issues a claim, so a
+    session without one for this user was already refused once.
+    """
+    if not claim or len(claim) != 5 or claim[0] != user_id:
+        return None
+    user = FirebaseUser.get_by_id(db, user_id)
+    if user is not None and claim[3] < user.session_version:
+        # Sessions were revoked after this claim was issued
+        _set_min_version(user_id, user.session_version)
+        return None
+    return user
+
+
+def load_user(db, user_id):
+    """Flask-Login user_loader: the claim when it is usable, otherwise the users document"""
+    if not ENABLED:
+        return FirebaseUser.get_by_id(db, user_id)
+
+    user = from_claim(user_id)
+    if user is not None:
+        return user
+    user = _stored_user(db, user_id, session.get(SESSION_KEY))
+    if user is None:
+        # Drop the login as well, or the next request would load this user id again
+        clear()
+        for key in SESSION_KEYS:
+            session.pop(key, None)
+        return None
+    issue(user)
+    return user
+
+
+def session_user_id(db, data):
+    """User id of a decoded session cookie if load_user would accept it, else None"""
+    user_id = data.get('_user_id')
+    if user_id is None or not ENABLED:
+        return user_id
+    claim = data.get(SESSION_KEY)
+    if _claim_user(claim, user_id) is not None or _stored_user(db, user_id, claim) is not None:
+        return user_id
+    return None
+
+
+def revoke(db, user_id):
+    """End all of the user's sessions by bumping `session_version`"""
+    try:
+        user_ref = db.collection('users').document(user_id)
+        user_ref.update({'session_version': firestore.Increment(1)})
+        version = user_ref.get().to_dict().get('session_version', 0)
+        _set_min_version(user_id, version)
+        return version
+    except Exception as e:
+        log_event(logger, logging.ERROR, "Error revoking sessions", error=str(e))
+        return None
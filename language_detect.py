@@ -0,0 +1,241 @@
+"""
+Offline language identification for translate requests with source='auto'.
+
+Scripts written by a single served language (Telugu, Hangul, Greek, ...)
+are resolved directly from Unicode ranges, and Cyrillic text only by letters
+unique to Russian or Ukrainian. Latin text is scored against a compact
+character-trigram model (language_model.json). When the answer is not
+clear-cut, detect() returns None and the caller falls back to the remote
+translator's own detection.
+"""
+import json
+import logging
+import math
+import os
+import sys
+from bisect import bisect_right
+from collections import Counter
+from app_logging import get_logger, log_event
+
+logger = get_logger(__name__)
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'language_model.json')
+
+# Trigrams kept per language when building the model
+PROFILE_SIZE = 400
+
+# Minimum letters before we trust any answer
+MIN_LETTERS = 4
+
+# Minimum trigrams before the n-gram model is trusted; short phrases such as
+# 'de nada' or 'chat noir' are shared between languages and often misread
+MIN_TRIGRAMS = 15
+
+# Minimum average log-probability gap (per trigram) between the best and second language
+MIN_MARGIN = 0.15
+
+# (first code point, script) ranges, sorted by start; gaps map to None
+_SCRIPT_RANGES = [
+    (0x0041, 'latin'), (0x005B, None), (0x0061, 'latin'), (0x007B, None),
+    (0x00C0, 'latin'), (0x00D7, None), (0x00D8, 'latin'), (0x00F7, None),
+    (0x00F8, 'latin'), (0x0250, None),
+    (0x0370, 'greek'), (0x0400, 'cyrillic'), (0x0530, None),
+    (0x0590, 'hebrew'), (0x0600, 'arabic'), (0x0700, None),
+    (0x0900, 'devanagari'), (0x0980, 'bengali'), (0x0A00, None),
+    (0x0B80, 'tamil'), (0x0C00, 'telugu'), (0x0C80, None),
+    (0x0E00, 'thai'), (0x0E80, None),
+    (0x1100, 'hangul'), (0x1200, None),
+    (0x1E00, 'latin'), (0x1F00, None),
+    (0x3040, 'kana'), (0x3100, None), (0x3130, 'hangul'), (0x3190, None),
+    (0x4E00, 'han'), (0xA000, None), (0xAC00, 'hangul'), (0xD7B0, None),
+]
+_SCRIPT_STARTS = [start for start, _ in _SCRIPT_RANGES]
+
+# Scripts that, in practice, only one language (one of ours) is written in.
+# Devanagari (Marathi, Nepali), Bengali (Assamese) and Arabic (Persian, Urdu)
+# are shared with languages we don't serve, so they go to the upstream detector.
+SCRIPT_LANGUAGES = {
+    'tamil': 'ta',
+    'telugu': 'te',
+    'thai': 'th',
+    'hangul': 'ko',
+    'kana': 'ja',
+    'greek': 'el',
+}
+
+# Cyrillic letters that rule Russian or Ukrainian in. Bulgarian, Belarusian,
+# Serbian, Kazakh and others share most of the alphabet, so text with none of
+# these (or with a letter of another language) goes to the upstream detector.
+# 'і' is Ukrainian and Belarusian, never Russian.
+_UKRAINIAN_LETTERS = set('їєґЇЄҐ')
+_RUSSIAN_LETTERS = set('ыэёЫЭЁ')
+_OTHER_CYRILLIC_LETTERS = set('ўјљњћђџѓќѕәғқңөұүһЎЈЉЊЋЂЏЃЌЅӘҒҚҢӨҰҮҺ')
+_VIETNAMESE_LETTERS = set('đơưạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹ')
+
+_model = None
+
+
+def script_of(char):
+    """Return the script name of a character, or None for digits/punctuation/unknown"""
+    index = bisect_right(_SCRIPT_STARTS, ord(char)) - 1
+    if index < 0:
+        return None
+    return _SCRIPT_RANGES[index][1]
+
+
+def _trigrams(text):
+    """Character trigrams of each word, padded with spaces"""
+    for word in text.lower().split():
+        word = ''.join(c for c in word if c.isalpha())
+        if not word:
+            continue
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+def load_model(path=MODEL_PATH):
+    """
+    Load the trigram model and invert it into trigram -> per-language scores.
+    Scores are stored as integer hundredths of a natural log-probability.
+    """
+    global _model
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+
+    model = {}
+    for script, languages in raw['scripts'].items():
+        codes = list(languages)
+        floors = tuple(languages[code]['floor'] / 100.0 for code in codes)
+        table = {}
+        for index, code in enumerate(codes):
+            for gram, score in languages[code]['trigrams'].items():
+                row = table.setdefault(gram, list(floors))
+                row[index] = score / 100.0
+        table = {gram: tuple(row) for gram, row in table.items()}
+        model[script] = (codes, floors, table)
+    _model = model
+    return model
+
+
+def _get_model():
+    if _model is None:
+        try:
+            load_model()
+        except (OSError, ValueError) as e:
+            log_event(logger, logging.WARNING, "Language model unavailable", error=str(e))
+            return {}
+    return _model
+
+
+def _score(text, script):
+    """Return (best language, margin per trigram) under the script's model"""
+    entry = _get_model().get(script)
+    if entry is None:
+        return None, 0.0
+    codes, floors, table = entry
+
+    totals = [0.0] * len(codes)
+    count = 0
+    for gram in _trigrams(text):
+        count += 1
+        row = table.get(gram, floors)
+        for i, score in enumerate(row):
+            totals[i] += score
+
+    if count < MIN_TRIGRAMS:
+        return None, 0.0
+    ranked = sorted(range(len(codes)), key=totals.__getitem__, reverse=True)
+    if len(ranked) == 1:
+        return codes[ranked[0]], float('inf')
+    margin = (totals[ranked[0]] - totals[ranked[1]]) / count
+    return codes[ranked[0]], margin
+
+
+def identify(text):
+    """
+    Return (language code, decided by script alone) for text, or (None, False)
+    when unsure. Codes match the ones the translator and the translate page use.
+    """
+    if not text:
+        return None, False
+
+    scripts = Counter()
+    for char in text:
+        script = script_of(char)
+        if script is not None:
+            scripts[script] += 1
+    letters = sum(scripts.values())
+    if letters < MIN_LETTERS:
+        return None, False
+
+    script, count = scripts.most_common(1)[0]
+    if count * 10 < letters * 7:
+        # Mixed scripts; a kana sprinkle inside Han text still means Japanese
+        if scripts['kana'] and scripts['kana'] + scripts['han'] == letters:
+            return 'ja', True
+        return None, False
+
+    if script == 'han':
+        # Simplified vs Traditional (or kanji-only Japanese) needs the upstream detector
+        return ('ja', True) if scripts['kana'] else (None, False)
+    if script in SCRIPT_LANGUAGES:
+        return SCRIPT_LANGUAGES[script], True
+
+    if script == 'cyrillic':
+        chars = set(text)
+        ukrainian = not chars.isdisjoint(_UKRAINIAN_LETTERS)
+        russian = not chars.isdisjoint(_RUSSIAN_LETTERS) and not chars & {'і', 'І'}
+        if ukrainian == russian or not chars.isdisjoint(_OTHER_CYRILLIC_LETTERS):
+            return None, False
+        return ('uk' if ukrainian else 'ru'), True
+    if script == 'latin':
+        if sum(1 for c in text.lower() if c in _VIETNAMESE_LETTERS) >= 2:
+            return 'vi', True
+
+    language, margin = _score(text, script)
+    if language is None or margin < MIN_MARGIN:
+        return None, False
+    return language, False
+
+
+def detect(text):
+    """Return a language code for text, or None when unsure"""
+    return identify(text)[0]
+
+
+def build_model(corpus_dir, output_path=MODEL_PATH, profile_size=PROFILE_SIZE):
+    """
+    Build language_model.json from <corpus_dir>/<lang>.txt training files.
+    Each language keeps its most frequent trigrams plus a floor score for unseen ones.
+    """
+    scripts = {}
+    for filename in sorted(os.listdir(corpus_dir)):
+        if not filename.endswith('.txt'):
+            continue
+        code = filename[:-4]
+        with open(os.path.join(corpus_dir, filename), encoding='utf-8') as f:
+            text = f.read()
+
+        letters = Counter(script_of(c) for c in text if script_of(c))
+        script = letters.most_common(1)[0][0]
+
+        counts = Counter(_trigrams(text))
+        total = sum(counts.values())
+        vocabulary = len(counts) + 1
+        top = counts.most_common(profile_size)
+        # Add-one smoothing; unseen trigrams get the floor
+        trigrams = {gram: round(math.log((n + 1) / (total + vocabulary)) * 100) for gram, n in top}
+        floor = round(math.log(1 / (total + vocabulary)) * 100)
+        scripts.setdefault(script, {})[code] = {'floor': floor, 'trigrams': trigrams}
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'scripts': scripts}, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    print(f"Wrote model for {sum(len(v) for v in scripts.values())} languages to {output_path}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python language_detect.py <corpus_dir>")
+        sys.exit(1)
+    build_model(sys.argv[1])
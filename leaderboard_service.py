@@ -0,0 +1,488 @@
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+import translation_service
+from app_logging import get_logger, log_event
+
+logger = get_logger(__name__)
+
+# How often (seconds) the in-memory boards are written back to Firestore
+SNAPSHOT_INTERVAL = 300
+
+# Entries per snapshot chunk document (keeps each doc well under 1 MiB)
+SNAPSHOT_CHUNK_SIZE = 2000
+
+# Firestore limits a write batch to 500 operations
+MAX_BATCH_WRITES = 500
+
+GLOBAL_BOARD = 'global'
+
+# Seconds before retrying a failed snapshot load (doubling up to the maximum)
+LOAD_RETRY_MIN = 5
+LOAD_RETRY_MAX = 300
+
+# Page size when seeding from user_stats
+PAGE_SIZE = 500
+
+
+class _Infinity:
+    """Sentinel key that sorts after every real key"""
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __ge__(self, other):
+        return True
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, next_nodes, widths):
+        self.key = key
+        self.next = next_nodes
+        self.width = widths
+
+
+class RankedSkipList:
+    """
+    Indexable skip list.
+    Each link stores how many bottom-level steps it spans, so insert, remove
+    and rank-of-key are O(log n) and fetching the k-th key is O(log n).
+    """
+
+    MAX_LEVELS = 24  # comfortably covers ~16M entries
+
+    def __init__(self):
+        self.size = 0
+        self._tail = _Node(_Infinity(), [], [])
+        self._head = _Node(None, [self._tail] * self.MAX_LEVELS, [1] * self.MAX_LEVELS)
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        return min(self.MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+
+    def insert(self, key):
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        depth = self._random_level()
+        new_node = _Node(key, [None] * depth, [None] * depth)
+        steps = 0
+        for level in range(depth):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(depth, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self._tail or target.key != key:
+            raise KeyError(key)
+
+        depth = len(target.next)
+        for level in range(depth):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(depth, self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index(self, key):
+        """Return the 0-based position of key, or None if it is not present"""
+        node = self._head
+        position = 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        candidate = node.next[0]
+        if candidate is self._tail or candidate.key != key:
+            return None
+        return position
+
+    def slice(self, start, count):
+        """Return up to count keys starting at 0-based position start"""
+        if start < 0 or start >= self.size or count <= 0:
+            return []
+
+        # Walk down to the node just before position start
+        node = self._head
+        remaining = start
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+
+        keys = []
+        node = node.next[0]
+        while node is not self._tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """A single ranked board of user scores (highest score first)"""
+
+    def __init__(self, board_id):
+        self.board_id = board_id
+        self.scores = {}
+        self._ranking = RankedSkipList()
+
+    def __len__(self):
+        return len(self.scores)
+
+    def set_score(self, user_id, score):
+        old_score = self.scores.get(user_id)
+        if old_score is not None:
+            self._ranking.remove((-old_score, user_id))
+        self.scores[user_id] = score
+        self._ranking.insert((-score, user_id))
+
+    def add_points(self, user_id, points):
+        self.set_score(user_id, self.scores.get(user_id, 0) + points)
+
+    def rank(self, user_id):
+        """Return the 1-based rank of a user, or None if they are not on the board"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self._ranking.index((-score, user_id)) + 1
+
+    def top(self, limit=10, offset=0):
+        """Return [(rank, user_id, score), ...] for the requested page"""
+        keys = self._ranking.slice(offset, limit)
+        return [(offset + i + 1, user_id, -neg_score) for i, (neg_score, user_id) in enumerate(keys)]
+
+
+def week_board_id(now=None):
+    """Board id for the ISO week containing now, e.g. 'weekly-2026-W42'"""
+    year, week, _ = (now or datetime.now()).isocalendar()
+    return f"weekly-{year}-W{week:02d}"
+
+
+def language_board_id(language_code):
+    return f"lang-{language_code}"
+
+
+class LeaderboardService:
+    """
+    In-memory global, per-language and weekly leaderboards.
+    Fed from the same places that increment `total_points`, restored from the
+    last Firestore snapshot at startup and snapshotted back periodically,
+    so ranking never needs to scan `user_stats`.
+
+    The boards live in the serving process, so they assume a single app
+    process (see gunicorn.conf.py). Extra workers each hold the last snapshot
+    plus only their own points, so gunicorn.conf.py turns snapshots off there
+    rather than let each worker overwrite the others' points. Nothing is
+    snapshotted until the last snapshot has been loaded either, so a failed
+    load can't overwrite the stored boards with a partial view.
+    """
+
+    def __init__(self, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.boards = {}
+        self.usernames = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+        self._snapshot_running = False
+        self.loaded = False
+        # Cleared when several workers serve the app (see gunicorn.conf.py)
+        self.snapshots_enabled = True
+        self._load_retry = LOAD_RETRY_MIN
+        self._next_load_attempt = 0.0
+
+    def _board(self, board_id):
+        board = self.boards.get(board_id)
+        if board is None:
+            board = self.boards[board_id] = Leaderboard(board_id)
+        return board
+
+    def _current_week_board(self):
+        board_id = week_board_id()
+        if board_id not in self.boards:
+            # New week: drop last week's board so it starts from zero
+            for stale_id in [b for b in self.boards if b.startswith('weekly-')]:
+                del self.boards[stale_id]
+        return self._board(board_id)
+
+    def resolve_board(self, board):
+        """Map a public board name ('global', 'weekly' or a language code) to a board id"""
+        if not board or board == GLOBAL_BOARD:
+            return GLOBAL_BOARD
+        if board == 'weekly':
+            return week_board_id()
+        return language_board_id(board)
+
+    def record_points(self, user_id, points, language=None, username=None):
+        """Apply a points increment to every board the user takes part in"""
+        if not points:
+            return
+        with self._lock:
+            if username:
+                self.usernames[user_id] = username
+            self._board(GLOBAL_BOARD).add_points(user_id, points)
+            self._current_week_board().add_points(user_id, points)
+            if language and translation_service.is_supported(language):
+                # Board ids become Firestore document ids; only known codes get a board
+                self._board(language_board_id(language)).add_points(user_id, points)
+            self._dirty = True
+
+    def top(self, board='global', limit=10, offset=0):
+        """Return a page of the board as a list of dicts"""
+        with self._lock:
+            if board == 'weekly':
+                leaderboard = self._current_week_board()
+            else:
+                leaderboard = self.boards.get(self.resolve_board(board))
+            if leaderboard is None:
+                return []
+            return [{
+                'rank': rank,
+                'user_id': user_id,
+                'username': self.usernames.get(user_id),
+                'points': score
+            } for rank, user_id, score in leaderboard.top(limit, offset)]
+
+    def rank(self, user_id, board='global'):
+        """Return the user's rank and points on a board, or None"""
+        with self._lock:
+            leaderboard = self.boards.get(self.resolve_board(board))
+            if leaderboard is None:
+                return None
+            position = leaderboard.rank(user_id)
+            if position is None:
+                return None
+            return {
+                'rank': position,
+                'points': leaderboard.scores[user_id],
+                'total_users': len(leaderboard)
+            }
+
+    def maybe_snapshot(self, db):
+        """Start a background snapshot if the boards changed and the interval elapsed"""
+        with self._lock:
+            due = time.monotonic() - self._last_snapshot >= self.snapshot_interval
+            if not (self._dirty and due and self.loaded and self.snapshots_enabled) or self._snapshot_running:
+                return False
+            self._snapshot_running = True
+        thread = threading.Thread(target=self._snapshot_in_background, args=(db,), daemon=True)
+        thread.start()
+        return True
+
+    def _snapshot_in_background(self, db):
+        try:
+            self.snapshot(db)
+        finally:
+            with self._lock:
+                self._snapshot_running = False
+
+    def snapshot(self, db):
+        """Write every board to `leaderboards/{board_id}` plus chunked entry docs"""
+        with self._lock:
+            if not (self.loaded and self.snapshots_enabled):
+                return False
+            copies = {board_id: list(board.scores.items()) for board_id, board in self.boards.items()}
+            usernames = dict(self.usernames)
+            self._dirty = False
+            self._last_snapshot = time.monotonic()
+
+        try:
+            batch = db.batch()
+            pending = 0
+            for board_id, entries in copies.items():
+                board_ref = db.collection('leaderboards').document(board_id)
+                chunks = [entries[i:i + SNAPSHOT_CHUNK_SIZE]
+                          for i in range(0, len(entries), SNAPSHOT_CHUNK_SIZE)]
+                batch.set(board_ref, {
+                    'chunk_count': len(chunks),
+                    'user_count': len(entries),
+                    'snapshot_at': datetime.now()
+                })
+                pending += 1
+                for index, chunk in enumerate(chunks):
+                    batch.set(board_ref.collection('chunks').document(str(index)), {
+                        'entries': [{'user_id': user_id, 'points': score, 'username': usernames.get(user_id)}
+                                    for user_id, score in chunk]
+                    })
+                    pending += 1
+                    if pending >= MAX_BATCH_WRITES - 1:
+                        batch.commit()
+                        batch = db.batch()
+                        pending = 0
+            if pending:
+                batch.commit()
+            return True
+        except Exception as e:
+            log_event(logger, logging.ERROR, "Error snapshotting leaderboards", error=str(e))
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def load_snapshot(self, db):
+        """Rebuild the boards from the last snapshot"""
+        try:
+            current_week = week_board_id()
+            boards = {}
+            usernames = {}
+            for board_doc in db.collection('leaderboards').stream():
+                board_id = board_doc.id
+                if board_id.startswith('weekly-') and board_id != current_week:
+                    continue
+                chunk_count = board_doc.to_dict().get('chunk_count', 0)
+                leaderboard = Leaderboard(board_id)
+                chunks_ref = board_doc.reference.collection('chunks')
+                for index in range(chunk_count):
+                    chunk = chunks_ref.document(str(index)).get()
+                    if not chunk.exists:
+                        continue
+                    for entry in chunk.to_dict().get('entries', []):
+                        leaderboard.set_score(entry['user_id'], entry['points'])
+                        if entry.get('username'):
+                            usernames[entry['user_id']] = entry['username']
+                boards[board_id] = leaderboard
+
+            with self._lock:
+                # Keep any points recorded before the snapshot finished loading
+                for board_id, board in self.boards.items():
+                    target = boards.setdefault(board_id, Leaderboard(board_id))
+                    for user_id, score in board.scores.items():
+                        target.add_points(user_id, score)
+                usernames.update(self.usernames)
+                self.boards = boards
+                self.usernames = usernames
+                self.loaded = True
+            return True
+        except Exception as e:
+            with self._lock:
+                # Retry later; points recorded meanwhile are merged in when a load succeeds
+                retry_in = self._load_retry
+                self._next_load_attempt = time.monotonic() + retry_in
+                self._load_retry = min(retry_in * 2, LOAD_RETRY_MAX)
+            log_event(logger, logging.ERROR, "Error loading leaderboard snapshot",
+                      error=str(e), retry_in=retry_in)
+            return False
+
+    def load_due(self):
+        return not self.loaded and time.monotonic() >= self._next_load_attempt
+
+    def seed_from_stats(self, db, page_size=PAGE_SIZE):
+        """
+        Set every user's global score to `user_stats.total_points`, with
+        usernames from `users`. Weekly and language boards only fill from
+        new points.
+        """
+        seeded = 0
+        for user_id, points in _stream_field(db, 'user_stats', 'total_points', page_size):
+            with self._lock:
+                self._board(GLOBAL_BOARD).set_score(user_id, points or 0)
+            seeded += 1
+        for user_id, username in _stream_field(db, 'users', 'username', page_size):
+            if username:
+                with self._lock:
+                    self.usernames[user_id] = username
+        with self._lock:
+            self._dirty = True
+        log_event(logger, logging.INFO, "Leaderboards seeded", users=seeded)
+        return seeded
+
+
+def _stream_field(db, collection, field, page_size):
+    """(document id, value) for one field of every document, paged by id"""
+    query = db.collection(collection).select([field]).order_by('__name__').limit(page_size)
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        docs = list(page.stream())
+        for doc in docs:
+            yield doc.id, doc.to_dict().get(field)
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+# Shared instance used by app.py
+leaderboards = LeaderboardService()
+
+
+_load_lock = threading.Lock()
+
+
+def ensure_loaded(db):
+    """Restore the boards from the last snapshot once per process (retrying with backoff)"""
+    if not leaderboards.load_due():
+        return
+    with _load_lock:
+        if leaderboards.load_due():
+            leaderboards.load_snapshot(db)
+
+
+def record_points(db, user_id, points, language=None, username=None):
+    """Feed a points increment into the leaderboards"""
+    ensure_loaded(db)
+    leaderboards.record_points(user_id, points, language=language, username=username)
+    leaderboards.maybe_snapshot(db)
+
+
+def main(argv=None):
+    """
+    python leaderboard_service.py seed
+
+    One-off: put existing users on the global board from their total_points.
+    Run it with the app stopped; a running app would snapshot its own boards over it.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ['seed']:
+        print("Usage: python leaderboard_service.py seed")
+        return 1
+
+    import clients
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db = clients.get_db()
+    if not leaderboards.load_snapshot(db):
+        print("Could not load the current snapshot; nothing written")
+        return 1
+    seeded = leaderboards.seed_from_stats(db)
+    leaderboards.snapshot(db)
+    print(f"Seeded the global board with {seeded} users")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Each process keeps its own counters and histograms and periodically writes
+them to METRICS_DIR/<pid>-<start>.json. The /metrics endpoint sums every
+file in that directory, so the output covers all gunicorn workers whichever
+worker serves the scrape. Files left by processes that are no longer running
+are removed when collected.
+"""
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'polyglotpal-metrics'))
+
+# Seconds between per-process snapshot writes
+FLUSH_INTERVAL = 5
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _labels_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+def _format_labels(labels_key, extra=None):
+    pairs = [tuple(p) for p in json.loads(labels_key)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _ensure_flusher()
+
+    def dump(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(into, values):
+        for key, value in values.items():
+            into[key] = into.get(key, 0) + value
+
+    def render(self, values):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key in sorted(values):
+            lines.append(f"{self.name}{_format_labels(key)} {values[key]}")
+        return lines
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            else:
+                entry['buckets'][-1] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+        _ensure_flusher()
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def dump(self):
+        with self._lock:
+            return {key: {'buckets': list(v['buckets']), 'sum': v['sum'], 'count': v['count']}
+                    for key, v in self._values.items()}
+
+    @staticmethod
+    def merge(into, values):
+        for key, value in values.items():
+            entry = into.get(key)
+            if entry is None:
+                into[key] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+                continue
+            entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+            entry['sum'] += value['sum']
+            entry['count'] += value['count']
+
+    def render(self, values):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key in sorted(values):
+            entry = values[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry['buckets']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {entry['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {entry['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {entry['count']}")
+        return lines
+
+
+class _Timer:
+    """Context manager that observes elapsed seconds into a histogram"""
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def counter(name, help_text):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Counter(name, help_text)
+        return _registry[name]
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, help_text, buckets)
+        return _registry[name]
+
+
+def timed(metric, **labels):
+    """Decorator that records the wrapped function's duration in a histogram"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metric.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Metrics used across the app ---------------------------------------------
+
+HTTP_REQUESTS = counter('http_requests_total', 'HTTP requests by endpoint, method and status')
+HTTP_LATENCY = histogram('http_request_seconds', 'HTTP request latency by endpoint')
+TRANSLATOR_LATENCY = histogram('translator_upstream_seconds', 'Remote translator call latency')
+FIRESTORE_LATENCY = histogram('firestore_call_seconds', 'Firestore call latency by model method')
+QUIZ_GENERATION_LATENCY = histogram('quiz_generation_seconds', 'Quiz question generation latency')
+CACHE_HITS = counter('cache_hits_total', 'Cache hits by cache')
+CACHE_MISSES = counter('cache_misses_total', 'Cache misses by cache')
+ERRORS = counter('errors_total', 'Handled errors by source')
+
+
+# --- Cross-process aggregation -------------------------------------------------
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+_process_file = None
+
+
+def _snapshot_path():
+    global _process_file
+    if _process_file is None or not _process_file.startswith(f"{os.getpid()}-"):
+        _process_file = f"{os.getpid()}-{int(time.time() * 1000)}.json"
+    return os.path.join(METRICS_DIR, _process_file)
+
+
+def _local_dump():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.dump() for metric in metrics}
+
+
+def flush():
+    """Write this process's metrics to its snapshot file"""
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = _snapshot_path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(_local_dump(), f)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        return False
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _ensure_flusher():
+    """Start the snapshot thread once per process (threads do not survive fork)"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_forever, daemon=True).start()
+
+
+def clear_snapshots():
+    """Remove snapshot files from a previous run (called once by the gunicorn master)"""
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for filename in os.listdir(METRICS_DIR):
+        if filename.endswith('.json') or filename.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(METRICS_DIR, filename))
+            except OSError:
+                pass
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        # os.kill would terminate the process on Windows; keep every snapshot there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _stale(filename):
+    """True for a snapshot whose process has exited"""
+    pid = filename.split('-', 1)[0]
+    return pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid))
+
+
+def collect():
+    """Merge every live process's snapshot (plus this process's live values)"""
+    merged = {}
+    local_ok = flush()
+    sources = []
+    if os.path.isdir(METRICS_DIR):
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(METRICS_DIR, filename)
+            if _stale(filename):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            sources.append(path)
+
+    dumps = []
+    for path in sources:
+        try:
+            with open(path) as f:
+                dumps.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    if not local_ok:
+        dumps.append(_local_dump())
+
+    with _registry_lock:
+        metrics = dict(_registry)
+    for dump in dumps:
+        for name, values in dump.items():
+            metric = metrics.get(name)
+            if metric is not None:
+                metric.merge(merged.setdefault(name, {}), values)
+    return merged
+
+
+def render():
+    """Prometheus text exposition format for all processes"""
+    merged = collect()
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render(merged.get(metric.name, {})))
+    return '\n'.join(lines) + '\n'
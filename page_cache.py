@@ -0,0 +1,102 @@
+"""
+Pre-rendered page shells.
+
+The app pages are hundreds of lines of markup with only a few per-user
+values (name, avatar initial, date). Each page is rendered once per process
+with marker strings in those slots and split into pre-encoded byte chunks;
+a request then only escapes its values and joins the chunks. Compiled
+templates also go to a Jinja bytecode cache on disk, so a fresh worker
+skips parsing them.
+
+Only pages whose remaining content is the same for every visitor belong in
+PAGES (login/signup show flashed messages and are rendered normally).
+"""
+import os
+import re
+import tempfile
+import threading
+from flask import Response
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR',
+                               os.path.join(tempfile.gettempdir(), 'polyglotpal-jinja'))
+
+# Page -> per-request slots
+PAGES = {
+    'index.html': (),
+    'dashboard.html': ('initial', 'name', 'date_today', 'events'),
+    'translate.html': ('initial', 'name', 'events'),
+    'quiz.html': (),
+}
+
+_MARKER = '\x00slot:{}\x00'
+_MARKER_RE = re.compile('\x00slot:([a-z_]+)\x00')
+
+
+class PageShell:
+    """A page split into static byte chunks and named slots"""
+
+    __slots__ = ('chunks', 'slots')
+
+    def __init__(self, html):
+        parts = _MARKER_RE.split(html)
+        # re.split alternates text and captured slot names
+        self.chunks = [part.encode('utf-8') for part in parts[0::2]]
+        self.slots = parts[1::2]
+
+    def render(self, values):
+        pieces = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            value = values.get(slot)
+            pieces.append(str(escape('' if value is None else value)).encode('utf-8'))
+            pieces.append(chunk)
+        return b''.join(pieces)
+
+
+class PageCache:
+    def __init__(self, pages=PAGES):
+        self.pages = pages
+        self.app = None
+        self._shells = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        try:
+            os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+        except OSError:
+            pass  # read-only filesystem: templates still compile in memory
+
+    def __contains__(self, name):
+        return name in self.pages
+
+    def _build(self, name):
+        env = self.app.jinja_env
+        markers = {slot: Markup(_MARKER.format(slot)) for slot in self.pages[name]}
+        with self.app.app_context():
+            return PageShell(env.get_template(name).render(**markers))
+
+    def shell(self, name):
+        # Development (auto_reload): re-render so template and asset edits show up
+        if self.app.jinja_env.auto_reload:
+            return self._build(name)
+        shell = self._shells.get(name)
+        if shell is None:
+            with self._lock:
+                shell = self._shells.get(name)
+                if shell is None:
+                    shell = self._shells[name] = self._build(name)
+        return shell
+
+    def render(self, page, **values):
+        return Response(self.shell(page).render(values), mimetype='text/html')
+
+    def warm(self):
+        for name in self.pages:
+            self.shell(name)
+
+
+# Shared instance used by app.py
+pages = PageCache()
@@ -0,0 +1,72 @@
+"""
+Import-time profile for app.py.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter and
+prints the total boot import time plus the slowest modules, so changes
+to cold start can be measured:
+
+    python profile_imports.py            # top 25 modules
+    python profile_imports.py --top 50 --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('firebase_admin', 'google.cloud.firestore', 'googletrans', 'grpc')
+
+
+def profile(module='app'):
+    """Return [(indented module name, self_us, cumulative_us)] for one import of module"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'import failed')
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        # Nested imports are indented under their importer; keep that for the totals
+        rows.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the import time of app.py')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--json', action='store_true', help='print a machine-readable report')
+    args = parser.parse_args(argv)
+
+    rows = profile(args.module)
+    top_level = [row for row in rows if not row[0].startswith(' ')]
+    total_us = sum(cumulative for _, _, cumulative in top_level)
+    loaded = {name.strip() for name, _, _ in rows}
+    heavy = sorted(m for m in HEAVY_MODULES if m in loaded)
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]
+
+    if args.json:
+        print(json.dumps({
+            'module': args.module,
+            'total_ms': round(total_us / 1000, 1),
+            'heavy_modules_loaded': heavy,
+            'slowest': [{'module': name.strip(), 'self_ms': round(s / 1000, 2), 'cumulative_ms': round(c / 1000, 2)}
+                        for name, s, c in slowest],
+        }, indent=2))
+        return
+
+    print(f"Importing {args.module}: {total_us / 1000:.1f} ms")
+    print(f"Heavy client libraries imported at boot: {', '.join(heavy) or 'none'}")
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cumulative_us in slowest:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+Per-language progress derived from translation and quiz events.
+
+Every event adds to a handful of counters for (user, language) in
+`language_progress/{user}/languages/{code}`:
+
+    translation into a language   words_learned += words in the text (capped)
+                                  translations += 1
+    quiz in a language            words_learned += correct answers
+                                  quizzes += 1, quiz_questions += total,
+                                  quiz_correct += correct
+
+progress_percent is words_learned against LanguageProgress.GOAL_WORDS and
+is filled in when progress is read. Recording an event is a dict update in
+memory. Pending counters are coalesced per (user, language) and written as
+Firestore increments, one batch per 500 keys: a timer thread flushes every
+FLUSH_INTERVAL seconds, and an event flushes early once FLUSH_SIZE keys are
+waiting. Increments keep the counters right across processes; unflushed
+events are lost if the process dies without exiting cleanly. Only
+languages in translation_service.LANGUAGES are counted, since the code
+becomes a document id.
+
+The backfill rebuilds the counters from history with the same rules. It
+streams both collections ordered by user and merges them, so it holds one
+user's languages plus a write batch at a time:
+
+    python progress_service.py backfill [--page-size N]
+
+Run it before the app records events, or while the app is stopped. Events
+recorded live during a backfill can be counted twice for the users they
+belong to.
+"""
+import argparse
+import atexit
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+import translation_service
+from app_logging import get_logger, log_event
+from firebase_models import LanguageProgress, MAX_BATCH_WRITES
+
+logger = get_logger(__name__)
+
+# Words one translation can add, so a pasted paragraph isn't a hundred words learned
+MAX_WORDS_PER_TRANSLATION = 10
+
+# Seconds between flushes, and pending (user, language) keys that flush early
+FLUSH_INTERVAL = 10
+FLUSH_SIZE = 400
+
+# Page size for the backfill
+PAGE_SIZE = 500
+
+TRANSLATION_FIELDS = ['user_id', 'source_text', 'source_lang', 'target_lang', 'timestamp']
+QUIZ_FIELDS = ['user_id', 'language', 'total_questions', 'correct_answers', 'timestamp']
+
+
+def translation_deltas(source_text, source_lang, target_lang):
+    """(language, counter deltas) for a translation, or None if it teaches nothing"""
+    if not translation_service.is_supported(target_lang) or target_lang == source_lang:
+        return None
+    words = min(len((source_text or '').split(None, MAX_WORDS_PER_TRANSLATION)), MAX_WORDS_PER_TRANSLATION)
+    return target_lang, {'words_learned': words, 'translations': 1}
+
+
+def quiz_deltas(language, total_questions, correct_answers):
+    """(language, counter deltas) for a quiz result, or None without a supported language"""
+    if not translation_service.is_supported(language):
+        return None
+    correct = correct_answers or 0
+    return language, {'words_learned': correct, 'quizzes': 1,
+                      'quiz_questions': total_questions or 0, 'quiz_correct': correct}
+
+
+def _accumulate(into, deltas, when):
+    for name, amount in deltas.items():
+        into[name] = into.get(name, 0) + amount
+    if when is not None and (into.get('last_practiced') is None or when > into['last_practiced']):
+        into['last_practiced'] = when
+
+
+class ProgressPipeline:
+    """
+    Pending progress counters, coalesced per (user, language).
+    A timer thread (one per process) flushes them every flush_interval;
+    events start an early flush when flush_size keys are waiting.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_running = False
+        self._db = None
+        self._timer_pid = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, change, when=None):
+        """Add (language, deltas) from translation_deltas/quiz_deltas for a user"""
+        if change is None or not user_id:
+            return
+        language, deltas = change
+        with self._lock:
+            values = self._pending.get((user_id, language))
+            if values is None:
+                values = self._pending[(user_id, language)] = {}
+            _accumulate(values, deltas, when or datetime.now())
+
+    def _ensure_timer(self):
+        # Called with the lock held; a forked worker starts its own timer
+        if self._timer_pid == os.getpid():
+            return
+        self._timer_pid = os.getpid()
+        threading.Thread(target=self._run_timer, name='progress-flush', daemon=True).start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.maybe_flush(self._db)
+
+    def maybe_flush(self, db):
+        """Start a background flush if enough is pending or the interval elapsed"""
+        with self._lock:
+            self._db = db
+            self._ensure_timer()
+            due = (len(self._pending) >= self.flush_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            if not (self._pending and due) or self._flush_running:
+                return False
+            self._flush_running = True
+        thread = threading.Thread(target=self._flush_in_background, args=(db,), daemon=True)
+        thread.start()
+        return True
+
+    def _flush_in_background(self, db):
+        try:
+            self.flush(db)
+        finally:
+            with self._lock:
+                self._flush_running = False
+
+    def flush(self, db):
+        """Write everything pending; keys that fail to write are kept for the next flush"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._last_flush = time.monotonic()
+
+        written = 0
+        items = iter(pending.items())
+        while True:
+            chunk = dict(islice(items, MAX_BATCH_WRITES))
+            if not chunk:
+                break
+            try:
+                LanguageProgress.apply_updates(db, chunk)
+                written += len(chunk)
+            except Exception as e:
+                log_event(logger, logging.ERROR, "Error flushing language progress", error=str(e))
+                written += self._write_each(db, chunk)
+        return written
+
+    def _write_each(self, db, chunk):
+        """
+        After a failed batch, write its keys one by one. Keys the client
+        rejects outright (bad document path or value) are dropped, so they
+        can't hold up everyone else; keys hit by other errors are requeued.
+        """
+        written = 0
+        unavailable = False
+        for key, values in chunk.items():
+            if not unavailable:
+                try:
+                    LanguageProgress.apply_updates(db, {key: values})
+                    written += 1
+                    continue
+                except (ValueError, TypeError) as e:
+                    log_event(logger, logging.ERROR, "Dropping unwritable language progress",
+                              user_id=key[0], language=key[1], error=str(e))
+                    continue
+                except Exception:
+                    # Firestore itself is failing; keep the rest for the next flush
+                    unavailable = True
+            with self._lock:
+                _accumulate(self._pending.setdefault(key, {}),
+                            {k: v for k, v in values.items() if k != 'last_practiced'},
+                            values.get('last_practiced'))
+        return written
+
+    def flush_at_exit(self):
+        if self._db is not None and self._pending:
+            self.flush(self._db)
+
+
+# Shared instance used by app.py
+pipeline = ProgressPipeline()
+atexit.register(pipeline.flush_at_exit)
+
+
+def record_translation(db, user_id, source_text, source_lang, target_lang):
+    pipeline.record(user_id, translation_deltas(source_text, source_lang, target_lang))
+    pipeline.maybe_flush(db)
+
+
+def record_quiz(db, user_id, language, total_questions, correct_answers):
+    pipeline.record(user_id, quiz_deltas(language, total_questions, correct_answers))
+    pipeline.maybe_flush(db)
+
+
+def _events_by_user(db, collection, fields, page_size):
+    """(user_id, collection, data) for every event, ordered by user id"""
+    query = db.collection(collection)\
+              .select(fields)\
+              .order_by('user_id')\
+              .order_by('__name__')\
+              .limit(page_size)
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        docs = list(page.stream())
+        for doc in docs:
+            data = doc.to_dict()
+            yield data['user_id'], collection, data
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+def _event_change(collection, data):
+    if collection == 'translations':
+        return translation_deltas(data.get('source_text'), data.get('source_lang'), data.get('target_lang'))
+    return quiz_deltas(data.get('language'), data.get('total_questions'), data.get('correct_answers'))
+
+
+def backfill(db, page_size=PAGE_SIZE):
+    """
+    Rebuild every user's progress counters from `translations` and
+    `quiz_results`, overwriting the stored ones.
+    """
+    events = heapq.merge(_events_by_user(db, 'translations', TRANSLATION_FIELDS, page_size),
+                         _events_by_user(db, 'quiz_results', QUIZ_FIELDS, page_size),
+                         key=lambda event: event[0])
+    updates = {}
+    user_progress = {}
+    current_user = None
+    users = 0
+    scanned = 0
+
+    def finish_user():
+        nonlocal updates
+        for language, values in user_progress.items():
+            updates[(current_user, language)] = values
+        if len(updates) >= MAX_BATCH_WRITES:
+            LanguageProgress.apply_updates(db, updates, replace=True)
+            updates = {}
+
+    for user_id, collection, data in events:
+        if user_id != current_user:
+            if current_user is not None:
+                finish_user()
+                users += 1
+            current_user = user_id
+            user_progress = {}
+        scanned += 1
+        change = _event_change(collection, data)
+        if change is not None:
+            language, deltas = change
+            _accumulate(user_progress.setdefault(language, {}), deltas, data.get('timestamp'))
+
+    if current_user is not None:
+        finish_user()
+        users += 1
+    if updates:
+        LanguageProgress.apply_updates(db, updates, replace=True)
+
+    log_event(logger, logging.INFO, "Progress backfill finished", users=users, events=scanned)
+    return {'users': users, 'events': scanned}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Language progress maintenance')
+    parser.add_argument('command', choices=['backfill'], help='rebuild progress for all users from history')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    import clients
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    print(backfill(clients.get_db(), page_size=args.page_size))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
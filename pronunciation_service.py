@@ -0,0 +1,302 @@
+"""
+Pronunciation (romanization) for translated text.
+
+Hindi, Telugu, Tamil, Russian, Ukrainian and kana-only Japanese are
+romanized offline so the result is the same on every request; other
+languages fall back to the pronunciation the translator returned. For
+Japanese the translator's reading is preferred when there is one.
+Pronunciations are cached separately from translations.
+"""
+import threading
+from collections import OrderedDict
+import metrics
+
+# Number of pronunciations kept in the in-process cache
+CACHE_SIZE = 8192
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# --- Indic scripts -----------------------------------------------------------
+# Devanagari, Telugu and Tamil share the ISCII layout, so one table indexed by
+# the offset from the start of each Unicode block covers all three.
+
+INDIC_BLOCKS = {
+    'hi': 0x0900,  # Devanagari
+    'te': 0x0C00,  # Telugu
+    'ta': 0x0B80,  # Tamil
+}
+
+_INDIC_VOWELS = {
+    0x05: 'a', 0x06: 'aa', 0x07: 'i', 0x08: 'ee', 0x09: 'u', 0x0A: 'oo',
+    0x0B: 'ri', 0x0C: 'li', 0x0D: 'e', 0x0E: 'e', 0x0F: 'e', 0x10: 'ai',
+    0x11: 'o', 0x12: 'o', 0x13: 'o', 0x14: 'au',
+}
+
+_INDIC_CONSONANTS = {
+    0x15: 'k', 0x16: 'kh', 0x17: 'g', 0x18: 'gh', 0x19: 'ng',
+    0x1A: 'ch', 0x1B: 'chh', 0x1C: 'j', 0x1D: 'jh', 0x1E: 'ny',
+    0x1F: 't', 0x20: 'th', 0x21: 'd', 0x22: 'dh', 0x23: 'n',
+    0x24: 't', 0x25: 'th', 0x26: 'd', 0x27: 'dh', 0x28: 'n', 0x29: 'n',
+    0x2A: 'p', 0x2B: 'ph', 0x2C: 'b', 0x2D: 'bh', 0x2E: 'm',
+    0x2F: 'y', 0x30: 'r', 0x31: 'r', 0x32: 'l', 0x33: 'l', 0x34: 'zh', 0x35: 'v',
+    0x36: 'sh', 0x37: 'sh', 0x38: 's', 0x39: 'h',
+    # Devanagari nukta forms
+    0x58: 'q', 0x59: 'kh', 0x5A: 'gh', 0x5B: 'z', 0x5C: 'r', 0x5D: 'rh', 0x5E: 'f', 0x5F: 'y',
+}
+
+_INDIC_VOWEL_SIGNS = {
+    0x3E: 'aa', 0x3F: 'i', 0x40: 'ee', 0x41: 'u', 0x42: 'oo', 0x43: 'ri', 0x44: 'ri',
+    0x45: 'e', 0x46: 'e', 0x47: 'e', 0x48: 'ai', 0x49: 'o', 0x4A: 'o', 0x4B: 'o', 0x4C: 'au',
+}
+
+_INDIC_MODIFIERS = {0x01: 'n', 0x02: 'n', 0x03: 'h'}
+_ANUSVARA = 0x02
+_LABIALS = {0x2A, 0x2B, 0x2C, 0x2D, 0x2E}
+
+_VIRAMA = 0x4D
+_INDIC_SILENT = {0x3C, 0x3D, 0x55, 0x56, 0x57}  # nukta, avagraha, length marks
+_INDIC_PUNCTUATION = {0x64: '.', 0x65: '.'}
+
+
+def _romanize_indic(text, lang):
+    base = INDIC_BLOCKS[lang]
+    # Hindi drops the inherent vowel at the end of a word (kamal, not kamala)
+    drop_final_a = lang == 'hi'
+    # Telugu and Tamil pronounce a word-final anusvara as 'm' (namaskaaram)
+    final_anusvara_m = lang != 'hi'
+
+    out = []
+    pending = None       # consonant still waiting for its vowel
+    word_letters = 0     # aksharas seen in the current word
+    seen_script = False
+
+    def flush(at_word_end):
+        nonlocal pending
+        if pending is not None:
+            out.append(pending if (at_word_end and drop_final_a and word_letters > 1) else pending + 'a')
+            pending = None
+
+    for index, char in enumerate(text):
+        offset = ord(char) - base
+        if not 0 <= offset < 0x80:
+            flush(at_word_end=True)
+            word_letters = 0
+            out.append(char)
+            continue
+
+        seen_script = True
+        if offset in _INDIC_CONSONANTS:
+            flush(at_word_end=False)
+            pending = _INDIC_CONSONANTS[offset]
+            word_letters += 1
+        elif offset in _INDIC_VOWEL_SIGNS:
+            out.append((pending or '') + _INDIC_VOWEL_SIGNS[offset])
+            pending = None
+        elif offset == _VIRAMA:
+            if pending is not None:
+                out.append(pending)
+                pending = None
+        elif offset in _INDIC_VOWELS:
+            flush(at_word_end=False)
+            out.append(_INDIC_VOWELS[offset])
+            word_letters += 1
+        elif offset == _ANUSVARA:
+            flush(at_word_end=False)
+            next_offset = ord(text[index + 1]) - base if index + 1 < len(text) else -1
+            at_word_end = not 0 <= next_offset < 0x80
+            out.append('m' if next_offset in _LABIALS or (at_word_end and final_anusvara_m) else 'n')
+        elif offset in _INDIC_MODIFIERS:
+            flush(at_word_end=False)
+            out.append(_INDIC_MODIFIERS[offset])
+        elif 0x66 <= offset <= 0x6F:
+            flush(at_word_end=True)
+            out.append(str(offset - 0x66))
+        elif offset in _INDIC_PUNCTUATION:
+            flush(at_word_end=True)
+            out.append(_INDIC_PUNCTUATION[offset])
+        elif offset not in _INDIC_SILENT:
+            flush(at_word_end=False)
+
+    flush(at_word_end=True)
+    return ''.join(out) if seen_script else None
+
+
+# --- Cyrillic ----------------------------------------------------------------
+
+_CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'і': 'i', 'ї': 'yi', 'є': 'ye', 'ґ': 'g', "'": '', '’': '',
+}
+
+# Ukrainian reads some letters differently from Russian
+_CYRILLIC_OVERRIDES = {
+    'uk': {'г': 'h', 'и': 'y'},
+}
+
+
+def _romanize_cyrillic(text, lang):
+    table = dict(_CYRILLIC, **_CYRILLIC_OVERRIDES.get(lang, {}))
+    out = []
+    seen_script = False
+    for char in text:
+        lower = char.lower()
+        roman = table.get(lower)
+        if roman is None or (lower in "'’" and not seen_script):
+            out.append(char)
+            continue
+        seen_script = True
+        if char != lower and roman:
+            roman = roman[0].upper() + roman[1:]
+        out.append(roman)
+    return ''.join(out) if seen_script else None
+
+
+# --- Kana (Hepburn) ----------------------------------------------------------
+
+_HIRAGANA = {
+    'あ': 'a', 'い': 'i', 'う': 'u', 'え': 'e', 'お': 'o',
+    'か': 'ka', 'き': 'ki', 'く': 'ku', 'け': 'ke', 'こ': 'ko',
+    'が': 'ga', 'ぎ': 'gi', 'ぐ': 'gu', 'げ': 'ge', 'ご': 'go',
+    'さ': 'sa', 'し': 'shi', 'す': 'su', 'せ': 'se', 'そ': 'so',
+    'ざ': 'za', 'じ': 'ji', 'ず': 'zu', 'ぜ': 'ze', 'ぞ': 'zo',
+    'た': 'ta', 'ち': 'chi', 'つ': 'tsu', 'て': 'te', 'と': 'to',
+    'だ': 'da', 'ぢ': 'ji', 'づ': 'zu', 'で': 'de', 'ど': 'do',
+    'な': 'na', 'に': 'ni', 'ぬ': 'nu', 'ね': 'ne', 'の': 'no',
+    'は': 'ha', 'ひ': 'hi', 'ふ': 'fu', 'へ': 'he', 'ほ': 'ho',
+    'ば': 'ba', 'び': 'bi', 'ぶ': 'bu', 'べ': 'be', 'ぼ': 'bo',
+    'ぱ': 'pa', 'ぴ': 'pi', 'ぷ': 'pu', 'ぺ': 'pe', 'ぽ': 'po',
+    'ま': 'ma', 'み': 'mi', 'む': 'mu', 'め': 'me', 'も': 'mo',
+    'や': 'ya', 'ゆ': 'yu', 'よ': 'yo',
+    'ら': 'ra', 'り': 'ri', 'る': 'ru', 'れ': 're', 'ろ': 'ro',
+    'わ': 'wa', 'ゐ': 'i', 'ゑ': 'e', 'を': 'o', 'ん': 'n', 'ゔ': 'vu',
+}
+_SMALL_Y = {'ゃ': 'a', 'ゅ': 'u', 'ょ': 'o'}
+_SMALL_VOWELS = {'ぁ': 'a', 'ぃ': 'i', 'ぅ': 'u', 'ぇ': 'e', 'ぉ': 'o', 'ゎ': 'a'}
+_SOKUON = 'っ'
+_LONG_MARK = 'ー'
+_KANA_PUNCTUATION = {'。': '.', '、': ',', '・': ' ', '「': '"', '」': '"', '？': '?', '！': '!'}
+_KATAKANA_OFFSET = 0x60
+
+# Hiragana は/へ ending a phrase are the topic/direction particles (こんにちは);
+# inside a phrase they can't be told apart from the syllables without a dictionary
+_PARTICLES = {'は': 'wa', 'へ': 'e'}
+
+
+def _to_hiragana(char):
+    code = ord(char)
+    if 0x30A1 <= code <= 0x30F6:
+        return chr(code - _KATAKANA_OFFSET)
+    return char
+
+
+def _ends_phrase(text, index):
+    """Whether the character after index ends a phrase (end of text, space or punctuation)"""
+    following = text[index + 1:index + 2]
+    return not following or following.isspace() or following in _KANA_PUNCTUATION
+
+
+def _romanize_kana(text, lang):
+    syllables = []
+    geminate = False
+    seen_script = False
+    for index, char in enumerate(text):
+        code = ord(char)
+        if 0x4E00 <= code <= 0x9FFF:
+            # Kanji readings need a dictionary; leave those to the translator
+            return None
+        kana = _to_hiragana(char)
+
+        if kana == _SOKUON:
+            geminate = True
+            seen_script = True
+            continue
+        if kana == _LONG_MARK and syllables:
+            syllables[-1] += syllables[-1][-1]
+            continue
+
+        if kana in _SMALL_Y and syllables:
+            previous = syllables.pop()
+            if previous.endswith(('shi', 'chi', 'ji')):
+                syllables.append(previous[:-1] + _SMALL_Y[kana])
+            else:
+                syllables.append(previous[:-1] + 'y' + _SMALL_Y[kana])
+            continue
+        if kana in _SMALL_VOWELS and syllables:
+            previous = syllables.pop()
+            syllables.append(previous[:-1] + _SMALL_VOWELS[kana])
+            continue
+
+        roman = _HIRAGANA.get(kana)
+        if char in _PARTICLES and syllables and not geminate and _ends_phrase(text, index):
+            roman = _PARTICLES[char]
+        if roman is None:
+            syllables.append(_KANA_PUNCTUATION.get(char, char))
+            geminate = False
+            continue
+
+        seen_script = True
+        if geminate:
+            roman = ('t' + roman) if roman.startswith('ch') else roman[0] + roman
+            geminate = False
+        syllables.append(roman)
+
+    return ''.join(syllables) if seen_script else None
+
+
+ROMANIZERS = {
+    'hi': _romanize_indic,
+    'te': _romanize_indic,
+    'ta': _romanize_indic,
+    'ru': _romanize_cyrillic,
+    'uk': _romanize_cyrillic,
+    'ja': _romanize_kana,
+}
+
+# Languages where the translator's reading, when it sends one, beats ours:
+# kana alone doesn't say where particles are
+UPSTREAM_FIRST = {'ja'}
+
+
+def transliterate(text, lang):
+    """Romanize text offline, or return None if there is no romanizer for it"""
+    romanizer = ROMANIZERS.get((lang or '').lower())
+    if romanizer is None or not text:
+        return None
+    return romanizer(text, lang.lower())
+
+
+def get_pronunciation(text, lang, upstream=None):
+    """
+    Return a pronunciation for text in lang.
+    Offline romanization wins over the translator's so it stays consistent,
+    except in UPSTREAM_FIRST languages; upstream pronunciations are cached
+    for languages we cannot romanize.
+    """
+    if not text:
+        return None
+    key = ((lang or '').lower(), text)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            metrics.CACHE_HITS.inc(cache='pronunciation')
+            return cached
+    metrics.CACHE_MISSES.inc(cache='pronunciation')
+
+    if upstream and key[0] in UPSTREAM_FIRST:
+        pronunciation = upstream
+    else:
+        pronunciation = transliterate(text, lang) or upstream
+    if pronunciation and pronunciation != text:
+        with _cache_lock:
+            _cache[key] = pronunciation
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return pronunciation
@@ -1,50 +1,70 @@
 import random
-from googletrans import Translator
+import logging
+import clients
+import metrics
+import pronunciation_service
+import vocabulary
+from app_logging import get_logger, log_event
 
-# Initialize translator
-translator = Translator()
+logger = get_logger(__name__)
 
-# Expanded vocabulary list organized by categories
-VOCAB_CATEGORIES = {
-    'greetings': ['Hello', 'Goodbye', 'Good morning', 'Good night', 'Thank you', 'Please', 'Sorry', 'Excuse me'],
-    'numbers': ['One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten'],
-    'colors': ['Red', 'Blue', 'Green', 'Yellow', 'Black', 'White', 'Orange', 'Purple', 'Pink', 'Brown'],
-    'food': ['Water', 'Bread', 'Rice', 'Milk', 'Coffee', 'Tea', 'Apple', 'Banana', 'Chicken', 'Fish'],
-    'family': ['Mother', 'Father', 'Sister', 'Brother', 'Grandmother', 'Grandfather', 'Daughter', 'Son', 'Family', 'Friend'],
-    'animals': ['Dog', 'Cat', 'Bird', 'Fish', 'Horse', 'Cow', 'Elephant', 'Lion', 'Tiger', 'Monkey'],
-    'body': ['Head', 'Hand', 'Foot', 'Eye', 'Ear', 'Nose', 'Mouth', 'Heart', 'Arm', 'Leg'],
-    'time': ['Today', 'Tomorrow', 'Yesterday', 'Morning', 'Afternoon', 'Evening', 'Night', 'Day', 'Week', 'Month'],
-    'places': ['Home', 'School', 'Work', 'Hospital', 'Restaurant', 'Store', 'Park', 'City', 'Country', 'Street'],
-    'common': ['Yes', 'No', 'Good', 'Bad', 'Big', 'Small', 'Hot', 'Cold', 'Happy', 'Sad', 'Love', 'Hate', 'Beautiful', 'Ugly']
+# Display names for the quiz question
+LANGUAGE_NAMES = {
+    'es': 'Spanish', 'fr': 'French', 'de': 'German', 
+    'hi': 'Hindi', 'te': 'Telugu', 'ta': 'Tamil',
+    'ja': 'Japanese', 'ko': 'Korean', 'zh-cn': 'Chinese',
+    'ar': 'Arabic', 'ru': 'Russian', 'pt': 'Portuguese',
+    'it': 'Italian', 'nl': 'Dutch', 'pl': 'Polish'
 }
 
-# Flatten all words into a single list
-ALL_WORDS = []
-for category, words in VOCAB_CATEGORIES.items():
-    ALL_WORDS.extend(words)
+OPTIONS_PER_QUESTION = 4
 
-def generate_quiz_data(target_lang='es'):
+
+def has_words(category=None):
+    """Whether a category (or the whole vocabulary) holds enough words for a question"""
+    return vocabulary.get_vocabulary().count(category) >= OPTIONS_PER_QUESTION
+
+
+def pick_words(category=None, difficulty=None):
+    """
+    Distinct quiz words from the vocabulary. When the category has too few
+    words at that difficulty, the difficulty is dropped; the category never
+    is (callers check has_words first), so ValueError means it is too small.
+    """
+    vocab = vocabulary.get_vocabulary()
+    if vocab.count(category, difficulty) >= OPTIONS_PER_QUESTION:
+        return vocab.sample(OPTIONS_PER_QUESTION, category, difficulty)
+    return vocab.sample(OPTIONS_PER_QUESTION, category)
+
+
+@metrics.timed(metrics.QUIZ_GENERATION_LATENCY)
+def generate_quiz_data(target_lang='es', category=None, difficulty=None):
     """
     Generates a quiz question with 4 options.
     Question is in English, answers are in the target language (Duolingo-style).
+    Words can be limited to a vocabulary category and/or difficulty (1-3, validated by the caller).
     Returns a dictionary with question, options, and correct_answer.
     """
     try:
-        # Pick 4 random words from vocabulary
-        selected_words = random.sample(ALL_WORDS, 4)
+        # Pick 4 distinct words from vocabulary, common words more often
+        selected_words = pick_words(category, difficulty)
         
         # First word is the correct answer
         correct_word = selected_words[0]
         
         # Translate all options to target language
+        translator = clients.get_translator()
         translated_options = []
         correct_translation = None
         
         for word in selected_words:
             try:
-                trans = translator.translate(word, dest=target_lang)
+                with metrics.TRANSLATOR_LATENCY.time(caller='quiz'):
+                    trans = translator.translate(word, dest=target_lang)
                 translated_text = trans.text
-                pronunciation = trans.pronunciation if trans.pronunciation else trans.text
+                pronunciation = pronunciation_service.get_pronunciation(
+                    translated_text, target_lang, trans.pronunciation
+                ) or trans.text
                 
                 translated_options.append({
                     'original': word,
@@ -58,7 +78,8 @@ def generate_quiz_data(target_lang='es'):
                     
             except Exception as e:
                 # Fallback if translation fails for a specific word
-                print(f"Translation failed for '{word}': {e}")
+                metrics.ERRORS.inc(source='quiz_translate')
+                log_event(logger, logging.WARNING, "Quiz translation failed", word=word, error=str(e))
                 translated_options.append({
                     'original': word,
                     'translated': word,  # Fallback to original
@@ -71,14 +92,7 @@ def generate_quiz_data(target_lang='es'):
         random.shuffle(translated_options)
         
         # Get language name for display
-        lang_names = {
-            'es': 'Spanish', 'fr': 'French', 'de': 'German', 
-            'hi': 'Hindi', 'te': 'Telugu', 'ta': 'Tamil',
-            'ja': 'Japanese', 'ko': 'Korean', 'zh-cn': 'Chinese',
-            'ar': 'Arabic', 'ru': 'Russian', 'pt': 'Portuguese',
-            'it': 'Italian', 'nl': 'Dutch', 'pl': 'Polish'
-        }
-        lang_name = lang_names.get(target_lang, target_lang.upper())
+        lang_name = LANGUAGE_NAMES.get(target_lang, target_lang.upper())
         
         return {
             'question': f"What is '{correct_word}' in {lang_name}?",
@@ -89,5 +103,6 @@ def generate_quiz_data(target_lang='es'):
         
     except Exception as e:
         # Better error handling
-        print(f"Quiz generation error: {str(e)}")
+        metrics.ERRORS.inc(source='quiz')
+        log_event(logger, logging.ERROR, "Quiz generation error", error=str(e))
         raise Exception(f"Quiz generation failed: {str(e)}")
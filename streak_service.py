@@ -0,0 +1,164 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import event_hub
+from app_logging import get_logger, log_event
+
+logger = get_logger(__name__)
+
+# Users whose (last activity date, streak) is kept in memory
+STATE_CACHE_SIZE = 10000
+
+# Page size for the nightly job (also the Firestore write batch limit)
+BATCH_SIZE = 500
+
+_state = OrderedDict()
+_state_lock = threading.Lock()
+
+
+def resolve_timezone(tz_name):
+    """Return a tzinfo for an IANA name, falling back to UTC"""
+    if not tz_name:
+        return timezone.utc
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+
+def local_date(tz_name, now=None):
+    """Today's date in the user's timezone"""
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(resolve_timezone(tz_name)).date()
+
+
+def next_streak(last_date, streak, today):
+    """Streak after activity on `today`, given the previous active date"""
+    if last_date == today:
+        return streak
+    if last_date == today - timedelta(days=1):
+        return streak + 1
+    return 1
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _cached_state(db, user_id):
+    with _state_lock:
+        state = _state.get(user_id)
+        if state is not None:
+            _state.move_to_end(user_id)
+            return state
+
+    # First event for this user in this process: one point read
+    doc = db.collection('user_stats').document(user_id).get()
+    data = doc.to_dict() if doc.exists else {}
+    return (
+        _parse_date(data.get('last_activity_date')),
+        data.get('streak_days', 0) or 0,
+        data.get('timezone')
+    )
+
+
+def _store_state(user_id, state):
+    with _state_lock:
+        _state[user_id] = state
+        _state.move_to_end(user_id)
+        while len(_state) > STATE_CACHE_SIZE:
+            _state.popitem(last=False)
+
+
+def record_activity(db, user_id, tz_name=None, now=None):
+    """
+    Update a user's streak for a translate or quiz event.
+    At most one Firestore write per user per local day; repeat events on the
+    same day are answered from memory.
+    """
+    try:
+        last_date, streak, stored_tz = _cached_state(db, user_id)
+        tz_name = tz_name or stored_tz
+        today = local_date(tz_name, now)
+
+        if last_date == today and tz_name == stored_tz:
+            _store_state(user_id, (last_date, streak, stored_tz))
+            return streak
+
+        streak = next_streak(last_date, streak, today)
+        db.collection('user_stats').document(user_id).set({
+            'streak_days': streak,
+            'last_activity_date': today.isoformat(),
+            'timezone': tz_name,
+            'last_updated': datetime.now()
+        }, merge=True)
+        _store_state(user_id, (today, streak, tz_name))
+        event_hub.hub.publish(user_id, 'stats', {'set': {'streak_days': streak}})
+        return streak
+    except Exception as e:
+        log_event(logger, logging.ERROR, "Error recording activity", error=str(e))
+        return None
+
+
+def run_nightly_job(db, now=None, page_size=BATCH_SIZE):
+    """
+    Reset broken streaks for all users.
+    Pages through `user_stats` by document id, reading only the streak fields,
+    and writes the resets for each page in a single batch.
+    """
+    now = now or datetime.now(timezone.utc)
+    query = db.collection('user_stats')\
+              .select(['streak_days', 'last_activity_date', 'timezone'])\
+              .order_by('__name__')\
+              .limit(page_size)
+
+    scanned = 0
+    reset = 0
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        docs = list(page.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        writes = 0
+        for doc in docs:
+            data = doc.to_dict()
+            streak = data.get('streak_days', 0) or 0
+            if not streak:
+                continue
+            today = local_date(data.get('timezone'), now)
+            last_date = _parse_date(data.get('last_activity_date'))
+            # Still alive if the user was active today or yesterday
+            if last_date is not None and last_date >= today - timedelta(days=1):
+                continue
+            batch.update(doc.reference, {'streak_days': 0, 'last_updated': datetime.now()})
+            writes += 1
+
+        if writes:
+            batch.commit()
+        scanned += len(docs)
+        reset += writes
+        last_doc = docs[-1]
+        if len(docs) < page_size:
+            break
+
+    log_event(logger, logging.INFO, "Streak job finished", scanned=scanned, reset=reset)
+    return {'scanned': scanned, 'reset': reset}
+
+
+if __name__ == '__main__':
+    import clients
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Same credentials as the app (FIREBASE_CREDENTIALS or FIREBASE_CREDENTIALS_PATH)
+    run_nightly_job(clients.get_db())
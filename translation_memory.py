@@ -0,0 +1,388 @@
+"""
+Translation memory built from the `translations` history.
+
+Text is stored per language pair, both whole and split into sentences. A
+text that matches a stored source exactly (ignoring only whitespace), or
+whose every sentence does, is reused without calling the translator. Near
+matches, including the same text with different case or punctuation, are
+found with MinHash signatures over character trigrams of the normalized
+text and LSH banding, then checked with the exact trigram Jaccard
+similarity, and offered as suggestions. Suggestions only come from the
+asking user's own history; exact reuse is shared, since it reveals nothing
+the translator wouldn't. Each worker starts from the newest HISTORY_LIMIT
+history documents and adds new translations as they are saved.
+
+Indexes are sorted uint64 arrays (key hash in the high bits, entry id in the
+low bits) plus a small dict of recent additions. Once the recent part grows
+past a quarter of the sorted part it is frozen and merged in on a
+background thread, in chunks, then swapped in; lookups keep reading the
+old array, the frozen part and newer additions meanwhile.
+"""
+import logging
+import os
+import random
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from app_logging import get_logger, log_event
+from clients import lazy_module
+
+firestore = lazy_module('firebase_admin.firestore')
+
+logger = get_logger(__name__)
+
+# MinHash: NUM_BANDS bands of ROWS_PER_BAND values; pairs with trigram
+# Jaccard above ~(1/NUM_BANDS)**(1/ROWS_PER_BAND) = 0.55 usually share a band
+NUM_BANDS = 6
+ROWS_PER_BAND = 3
+NUM_HASHES = NUM_BANDS * ROWS_PER_BAND
+
+# Minimum trigram Jaccard similarity for a suggestion (one changed word in a
+# short sentence is about 0.6-0.7)
+SUGGEST_THRESHOLD = 0.6
+
+# Candidates checked per band, newest first
+MAX_CANDIDATES = 32
+
+# Most recent history documents read when a worker starts; every worker
+# reads them, so this is the Firestore read cost of each boot
+HISTORY_LIMIT = int(os.getenv('TM_HISTORY_LIMIT', '20000'))
+PAGE_SIZE = 500
+
+ID_BITS = 28
+ID_MASK = (1 << ID_BITS) - 1
+KEY_MASK = (1 << (64 - ID_BITS)) - 1
+
+# Merge recent additions once they exceed this or 1/4 of the sorted part
+MIN_MERGE = 4096
+
+# Elements handled per step of a background merge (each step holds the GIL briefly)
+MERGE_CHUNK = 65536
+
+# Multiply-add hashes mod 2**64 (odd multipliers) stand in for random permutations
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(40)
+_PERMUTATIONS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_HASHES)]
+
+# Sentence boundaries, kept as separators so segments can be reassembled
+_SEGMENT_RE = re.compile(r'((?<=[.!?。！？])\s+|\n+)')
+
+
+def collapse(text):
+    """Text with whitespace runs collapsed; the only difference exact reuse ignores"""
+    return ' '.join(text.split())
+
+
+def normalize(text):
+    """Case-folded text with punctuation dropped and whitespace collapsed (for similarity)"""
+    text = ''.join(' ' if unicodedata.category(ch).startswith('P') else ch for ch in text.casefold())
+    return ' '.join(text.split())
+
+
+def split_segments(text):
+    """[segment, separator, segment, ...] for sentence-level reuse"""
+    return _SEGMENT_RE.split(text.strip())
+
+
+def trigrams(normalized):
+    padded = f" {normalized} "
+    if len(padded) < 3:
+        return {padded}
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(shingles):
+    hashes = [hash(s) for s in shingles]
+    return [min([(a * x + b) & _MASK64 for x in hashes]) for a, b in _PERMUTATIONS]
+
+
+def _merge_sorted(sorted_ids, items):
+    """
+    sorted_ids (array('Q')) merged with unsorted items into a new array,
+    a chunk at a time so a background merge never holds the GIL for long.
+    """
+    runs = [sorted(items[i:i + MERGE_CHUNK]) for i in range(0, len(items), MERGE_CHUNK)]
+    items = list(merge(*runs)) if len(runs) > 1 else (runs[0] if runs else [])
+    merged = array('Q')
+    start = 0
+    for lo in range(0, len(sorted_ids), MERGE_CHUNK):
+        hi = lo + MERGE_CHUNK
+        end = bisect_left(items, sorted_ids[hi], start) if hi < len(sorted_ids) else len(items)
+        chunk = sorted_ids[lo:hi].tolist()
+        chunk.extend(items[start:end])
+        chunk.sort()
+        merged.extend(chunk)
+        start = end
+    merged.extend(items[start:])
+    return merged
+
+
+class _SortedIndex:
+    """
+    Multimap from a 36-bit key to entry ids.
+    Callers hold a lock around every method except build_merge, which only
+    reads the sorted array and the frozen part (neither changes until install).
+    """
+
+    __slots__ = ('_sorted', '_frozen', '_recent', '_recent_count')
+
+    def __init__(self):
+        self._sorted = array('Q')
+        self._frozen = {}
+        self._recent = {}
+        self._recent_count = 0
+
+    def add(self, key, entry_id):
+        self._recent.setdefault(key, []).append(entry_id)
+        self._recent_count += 1
+
+    def merge_due(self):
+        return not self._frozen and self._recent_count > max(MIN_MERGE, len(self._sorted) // 4)
+
+    def freeze(self):
+        """Set the recent additions aside for a background merge"""
+        self._frozen = self._recent
+        self._recent = {}
+        self._recent_count = 0
+
+    def build_merge(self):
+        items = [(key << ID_BITS) | entry_id for key, ids in self._frozen.items() for entry_id in ids]
+        return _merge_sorted(self._sorted, items)
+
+    def install(self, merged):
+        self._sorted = merged
+        self._frozen = {}
+
+    def get(self, key, limit):
+        """Up to limit ids for key, newest first"""
+        ids = list(reversed(self._recent.get(key, ())))
+        ids.extend(reversed(self._frozen.get(key, ())))
+        if len(ids) < limit:
+            hi = bisect_left(self._sorted, (key + 1) << ID_BITS)
+            lo = max(bisect_left(self._sorted, key << ID_BITS), hi - (limit - len(ids)))
+            ids.extend(self._sorted[i] & ID_MASK for i in range(hi - 1, lo - 1, -1))
+        return ids[:limit]
+
+
+class TranslationMemory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pairs = {}
+        self._owners = {}
+        self.sources = []
+        self.targets = []
+        self._pair_of = array('H')
+        self._owner_of = array('I')
+        self._exact = _SortedIndex()
+        self._bands = [_SortedIndex() for _ in range(NUM_BANDS)]
+        self._merging = False
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.sources)
+
+    def _pair_id(self, src, dest, create=False):
+        pair = (src, dest)
+        pair_id = self._pairs.get(pair)
+        if pair_id is None and create:
+            pair_id = self._pairs[pair] = len(self._pairs)
+        return pair_id
+
+    def _owner_id(self, owner):
+        # 0 means no owner (never offered as a suggestion)
+        if owner is None:
+            return 0
+        owner_id = self._owners.get(owner)
+        if owner_id is None:
+            owner_id = self._owners[owner] = len(self._owners) + 1
+        return owner_id
+
+    def _find_exact(self, pair_id, exact, owner_id=None):
+        key = hash((pair_id, exact)) & KEY_MASK
+        for entry_id in self._exact.get(key, MAX_CANDIDATES):
+            if (self._pair_of[entry_id] == pair_id and collapse(self.sources[entry_id]) == exact
+                    and (owner_id is None or self._owner_of[entry_id] == owner_id)):
+                return entry_id
+        return None
+
+    def _add_segment(self, source, target, signature, pair_id, owner_id):
+        exact = collapse(source)
+        if self._find_exact(pair_id, exact, owner_id) is not None:
+            return
+        entry_id = len(self.sources)
+        if entry_id > ID_MASK:
+            return
+        self.sources.append(source)
+        self.targets.append(target)
+        self._pair_of.append(pair_id)
+        self._owner_of.append(owner_id)
+        self._exact.add(hash((pair_id, exact)) & KEY_MASK, entry_id)
+        for band, index in enumerate(self._bands):
+            rows = tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+            index.add(hash((pair_id, band, rows)) & KEY_MASK, entry_id)
+
+    def add(self, source_text, translated_text, src, dest, owner=None):
+        """Remember a translation, plus its sentences when both sides split alike"""
+        if not source_text or not translated_text or 'auto' in (src, dest):
+            return
+        segments = [(source_text.strip(), translated_text.strip())]
+        source_parts = split_segments(source_text)
+        target_parts = split_segments(translated_text)
+        if len(source_parts) > 1 and len(source_parts) == len(target_parts):
+            segments += zip(source_parts[0::2], target_parts[0::2])
+
+        # Signatures are the expensive part; compute them before taking the lock
+        prepared = []
+        for source, target in segments:
+            normalized = normalize(source)
+            if normalized:
+                prepared.append((source, target, minhash(trigrams(normalized))))
+
+        with self._lock:
+            pair_id = self._pair_id(src, dest, create=True)
+            owner_id = self._owner_id(owner)
+            for source, target, signature in prepared:
+                self._add_segment(source, target, signature, pair_id, owner_id)
+            self._start_merge()
+
+    def _start_merge(self):
+        # Called with the lock held
+        if self._merging:
+            return
+        due = [index for index in (self._exact, *self._bands) if index.merge_due()]
+        if not due:
+            return
+        for index in due:
+            index.freeze()
+        self._merging = True
+        threading.Thread(target=self._merge, args=(due,), name='translation-memory-merge', daemon=True).start()
+
+    def _merge(self, indexes):
+        """Merge frozen additions into each index off the request path, then swap them in"""
+        try:
+            for index in indexes:
+                merged = index.build_merge()
+                with self._lock:
+                    index.install(merged)
+        except Exception as e:
+            log_event(logger, logging.ERROR, "Error merging translation memory index", error=str(e))
+        finally:
+            with self._lock:
+                self._merging = False
+
+    def lookup(self, text, src, dest):
+        """
+        Stored translation for text (same source up to whitespace), or one
+        assembled from stored translations of each of its sentences; None otherwise.
+        """
+        with self._lock:
+            pair_id = self._pair_id(src, dest)
+            if pair_id is None:
+                return None
+            entry_id = self._find_exact(pair_id, collapse(text))
+            if entry_id is not None:
+                return self.targets[entry_id]
+
+            parts = split_segments(text)
+            if len(parts) < 3:
+                return None
+            assembled = []
+            for i, part in enumerate(parts):
+                if i % 2:
+                    assembled.append(part)
+                    continue
+                entry_id = self._find_exact(pair_id, collapse(part))
+                if entry_id is None:
+                    return None
+                assembled.append(self.targets[entry_id])
+            return ''.join(assembled)
+
+    def suggest(self, text, src, dest, owner, limit=3):
+        """
+        The owner's earlier translations of similar text, most similar first.
+        Case and punctuation variants count as similar; the exact text doesn't
+        (lookup already reuses it).
+        """
+        normalized = normalize(text)
+        if not normalized:
+            return []
+        exact = collapse(text)
+        query = trigrams(normalized)
+        signature = minhash(query)
+        with self._lock:
+            pair_id = self._pair_id(src, dest)
+            owner_id = self._owners.get(owner)
+            if pair_id is None or owner_id is None:
+                return []
+            candidates = set()
+            for band, index in enumerate(self._bands):
+                rows = tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+                for entry_id in index.get(hash((pair_id, band, rows)) & KEY_MASK, MAX_CANDIDATES):
+                    if self._pair_of[entry_id] == pair_id and self._owner_of[entry_id] == owner_id:
+                        candidates.add(entry_id)
+            entries = [(entry_id, self.sources[entry_id], self.targets[entry_id]) for entry_id in candidates]
+
+        scored = []
+        for entry_id, source, target in entries:
+            if collapse(source) == exact:
+                continue
+            similarity = jaccard(query, trigrams(normalize(source)))
+            if similarity >= SUGGEST_THRESHOLD:
+                scored.append((similarity, entry_id, source, target))
+        scored.sort(reverse=True)
+        return [{'source': source, 'translated': target, 'similarity': round(similarity, 3)}
+                for similarity, _, source, target in scored[:limit]]
+
+    def load(self, db, limit=HISTORY_LIMIT, page_size=PAGE_SIZE):
+        """Fill the memory from the newest `translations` documents, read in pages"""
+        query = db.collection('translations')\
+                  .select(['user_id', 'source_text', 'translated_text', 'source_lang', 'target_lang'])\
+                  .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        rows = []
+        last_doc = None
+        try:
+            while len(rows) < limit:
+                size = min(page_size, limit - len(rows))
+                page = query.start_after(last_doc) if last_doc is not None else query
+                docs = list(page.limit(size).stream())
+                for doc in docs:
+                    data = doc.to_dict()
+                    rows.append((data.get('source_text'), data.get('translated_text'),
+                                 data.get('source_lang'), data.get('target_lang'), data.get('user_id')))
+                if len(docs) < size:
+                    break
+                last_doc = docs[-1]
+            # Oldest first, so later entries stay the newest ones as in live use
+            for row in reversed(rows):
+                self.add(*row)
+            log_event(logger, logging.INFO, "Translation memory loaded", documents=len(rows), segments=len(self))
+        except Exception as e:
+            log_event(logger, logging.ERROR, "Error loading translation memory", error=str(e))
+        finally:
+            self.loaded = True
+
+
+# Shared instance; TranslationHistory.add_translation feeds it
+memory = TranslationMemory()
+
+_load_started = False
+_load_lock = threading.Lock()
+
+
+def ensure_loaded(db):
+    """Load the history in a background thread, once per process"""
+    global _load_started
+    with _load_lock:
+        if _load_started:
+            return
+        _load_started = True
+    threading.Thread(target=memory.load, args=(db,), name='translation-memory', daemon=True).start()
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+import clients
+import language_detect
+import metrics
+import pronunciation_service
+import translation_memory
+
+# Language codes the translate and quiz pages offer. Codes from clients end
+# up in Firestore document ids (leaderboards, progress), so check them here.
+LANGUAGES = frozenset([
+    'ar', 'bn', 'da', 'de', 'el', 'en', 'es', 'fi', 'fr', 'hi', 'it', 'ja', 'ko', 'nl', 'no',
+    'pl', 'pt', 'ru', 'sv', 'ta', 'te', 'th', 'tr', 'uk', 'vi', 'zh-cn', 'zh-tw',
+])
+
+# Number of translations kept in the in-process cache
+CACHE_SIZE = 4096
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class TranslationResult:
+    """Same attributes app.py reads from a googletrans result"""
+
+    __slots__ = ('text', 'pronunciation', 'src', 'dest')
+
+    def __init__(self, text, pronunciation, src, dest):
+        self.text = text
+        self.pronunciation = pronunciation
+        self.src = src
+        self.dest = dest
+
+
+def normalize_lang(code):
+    return (code or 'auto').strip().lower()
+
+
+def is_supported(code):
+    return code in LANGUAGES
+
+
+def cache_key(text, source_lang, target_lang):
+    """Stable key: resolved language pair plus whitespace-normalized text"""
+    return (normalize_lang(source_lang), normalize_lang(target_lang), ' '.join(text.split()))
+
+
+def _cache_get(key):
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+        return result
+
+
+def _cache_put(key, result):
+    with _cache_lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def resolve_source(text, source_lang):
+    """
+    Replace 'auto' with a locally detected language when we are confident.
+    Returns (source language, certain); certain is False only for an n-gram
+    guess, which is passed upstream but never trusted to skip translation.
+    """
+    source_lang = normalize_lang(source_lang)
+    if source_lang == 'auto':
+        language, by_script = language_detect.identify(text)
+        return language or 'auto', by_script
+    return source_lang, True
+
+
+def translate(text, source_lang='auto', target_lang='en'):
+    """
+    Translate text, detecting the source language locally where possible.
+    Same-language requests return immediately and repeat requests are served
+    from the cache or the translation memory, so none reach the remote translator.
+    """
+    target_lang = normalize_lang(target_lang)
+    source_lang, certain = resolve_source(text, source_lang)
+
+    if source_lang == target_lang:
+        if certain:
+            return TranslationResult(text, None, source_lang, target_lang)
+        # A statistical guess that the text is already in the target language; let upstream decide
+        source_lang = 'auto'
+
+    key = cache_key(text, source_lang, target_lang)
+    cached = _cache_get(key)
+    if cached is not None:
+        metrics.CACHE_HITS.inc(cache='translation')
+        return cached
+    metrics.CACHE_MISSES.inc(cache='translation')
+
+    # Translation memory: the same text up to whitespace, or every one of its sentences
+    if source_lang != 'auto':
+        remembered = translation_memory.memory.lookup(text, source_lang, target_lang)
+        if remembered is not None:
+            metrics.CACHE_HITS.inc(cache='translation_memory')
+            pronunciation = pronunciation_service.get_pronunciation(remembered, target_lang)
+            result = TranslationResult(remembered, pronunciation, source_lang, target_lang)
+            _cache_put(key, result)
+            return result
+        metrics.CACHE_MISSES.inc(cache='translation_memory')
+
+    # Initialize translator per request for stability
+    translator = clients.new_translator()
+    with metrics.TRANSLATOR_LATENCY.time(caller='translate'):
+        translation = translator.translate(text, src=source_lang, dest=target_lang)
+    pronunciation = pronunciation_service.get_pronunciation(
+        translation.text, translation.dest, translation.pronunciation
+    )
+    result = TranslationResult(translation.text, pronunciation, translation.src, translation.dest)
+
+    _cache_put(key, result)
+    if source_lang == 'auto' and translation.src:
+        # Upstream told us the language; later requests can hit the resolved key too
+        _cache_put(cache_key(text, translation.src, target_lang), result)
+    return result
@@ -0,0 +1,202 @@
+"""
+Quiz vocabulary with indexed, frequency-weighted sampling.
+
+Word lists are tab-separated files (optionally gzipped), one entry per line:
+
+    word<TAB>category<TAB>frequency<TAB>difficulty
+
+frequency is on the Zipf scale (log10 occurrences per billion words, about
+1-7) and is the sampling weight, so it must be positive; difficulty is 1 (beginner) to 3. Lines
+starting with '#' are comments. Words are deduplicated case-insensitively:
+a word listed under several categories is one entry that belongs to each.
+
+Every (category, difficulty) combination gets an array-backed alias table
+(Vose's method), so drawing a word is O(1) however large the list.
+VOCABULARY_PATH points at a different list (e.g. a large generated one).
+
+    python vocabulary.py [path]          # summary of a word list
+"""
+import gzip
+import os
+import random
+import sys
+import threading
+from array import array
+
+VOCABULARY_PATH = os.getenv(
+    'VOCABULARY_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vocabulary.tsv'))
+
+DIFFICULTIES = (1, 2, 3)
+
+# Weighted draws per requested word before sample() picks the rest uniformly
+DRAWS_PER_WORD = 16
+
+
+class WeightedIndex:
+    """Word ids with an alias table for O(1) weighted draws"""
+
+    __slots__ = ('ids', '_prob', '_alias')
+
+    def __init__(self, ids, weights):
+        self.ids = array('I', ids)
+        count = len(ids)
+        self._prob = array('d', bytes(8 * count))
+        self._alias = array('I', bytes(4 * count))
+        total = sum(weights)
+        if not count or total <= 0:
+            self._prob = array('d', [1.0] * count)
+            return
+
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            self._prob[low] = scaled[low]
+            self._alias[low] = high
+            scaled[high] += scaled[low] - 1.0
+            (small if scaled[high] < 1.0 else large).append(high)
+        for i in small + large:
+            # Leftovers are 1.0 up to rounding error
+            self._prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def draw(self, rng=random):
+        """One word id, chosen with probability proportional to its weight"""
+        slot = int(rng.random() * len(self.ids))
+        if rng.random() >= self._prob[slot]:
+            slot = self._alias[slot]
+        return self.ids[slot]
+
+
+class Vocabulary:
+    """Deduplicated word list with per-category/difficulty indexes"""
+
+    def __init__(self, entries=()):
+        self.words = []
+        self.categories = []
+        self.frequency = array('f')
+        self.difficulty = array('B')
+        self._ids = {}
+        for word, category, frequency, difficulty in entries:
+            self.add(word, category, frequency, difficulty)
+        self._indexes = {}
+        self.build_indexes()
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word, category, frequency, difficulty):
+        """Add an entry, merging it into an existing word with the same spelling"""
+        key = word.casefold()
+        word_id = self._ids.get(key)
+        if word_id is None:
+            self._ids[key] = len(self.words)
+            self.words.append(word)
+            self.categories.append((category,))
+            self.frequency.append(frequency)
+            self.difficulty.append(difficulty)
+            return
+        if category not in self.categories[word_id]:
+            self.categories[word_id] += (category,)
+        self.frequency[word_id] = max(self.frequency[word_id], frequency)
+        self.difficulty[word_id] = min(self.difficulty[word_id], difficulty)
+
+    def build_indexes(self):
+        """Alias tables for all words, each category, each difficulty and each pair"""
+        groups = {}
+        for word_id, categories in enumerate(self.categories):
+            difficulty = self.difficulty[word_id]
+            keys = [(None, None), (None, difficulty)]
+            for category in categories:
+                keys += [(category, None), (category, difficulty)]
+            for key in keys:
+                groups.setdefault(key, []).append(word_id)
+        self._indexes = {key: WeightedIndex(ids, [self.frequency[i] for i in ids])
+                         for key, ids in groups.items()}
+
+    def category_names(self):
+        return sorted({key[0] for key in self._indexes if key[0] is not None})
+
+    def count(self, category=None, difficulty=None):
+        index = self._indexes.get((category, difficulty))
+        return len(index) if index is not None else 0
+
+    def sample(self, k, category=None, difficulty=None, rng=random):
+        """
+        k distinct words, weighted by frequency, from the given category and/or
+        difficulty. Raises ValueError if that selection has fewer than k words.
+        """
+        index = self._indexes.get((category, difficulty))
+        if index is None or len(index) < k:
+            raise ValueError(f"Fewer than {k} words for category={category!r}, difficulty={difficulty!r}")
+        if len(index) <= 2 * k:
+            # Rejection would mostly redraw; pick uniformly instead
+            return [self.words[i] for i in rng.sample(list(index.ids), k)]
+
+        chosen = []
+        seen = set()
+        for _ in range(DRAWS_PER_WORD * k):
+            word_id = index.draw(rng)
+            if word_id not in seen:
+                seen.add(word_id)
+                chosen.append(self.words[word_id])
+                if len(chosen) == k:
+                    return chosen
+        # The weight sits on fewer than k words; fill up uniformly
+        remaining = [i for i in index.ids if i not in seen]
+        return chosen + [self.words[i] for i in rng.sample(remaining, k - len(chosen))]
+
+
+def read_entries(path):
+    """Yield (word, category, frequency, difficulty) from a .tsv or .tsv.gz word list"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            try:
+                word, category, frequency, difficulty = line.split('\t')
+                difficulty = int(difficulty)
+                if difficulty not in DIFFICULTIES:
+                    raise ValueError(f"difficulty {difficulty}")
+                frequency = float(frequency)
+                if not 0 < frequency < float('inf'):
+                    raise ValueError(f"frequency {frequency}")
+                yield word.strip(), category.strip(), frequency, difficulty
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: bad vocabulary line ({e})") from None
+
+
+def load(path=VOCABULARY_PATH):
+    return Vocabulary(read_entries(path))
+
+
+_vocabulary = None
+_load_lock = threading.Lock()
+
+
+def get_vocabulary():
+    """The shared vocabulary, loaded on first use"""
+    global _vocabulary
+    if _vocabulary is None:
+        with _load_lock:
+            if _vocabulary is None:
+                _vocabulary = load()
+    return _vocabulary
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    vocab = load(argv[0] if argv else VOCABULARY_PATH)
+    print(f"{len(vocab)} words")
+    for category in vocab.category_names():
+        counts = ', '.join(f"level {d}: {vocab.count(category, d)}" for d in DIFFICULTIES)
+        print(f"  {category:<16}{vocab.count(category):>7}  ({counts})")
+
+
+if __name__ == '__main__':
+    sys.exit(main())